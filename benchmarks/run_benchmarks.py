@@ -0,0 +1,294 @@
+"""
+Benchmarks of loading, filtering, epoching and amplitude extraction on synthetic data.
+
+Every benchmark runs in a fresh process, so its peak memory is not hidden by an earlier one,
+and the results are written to JSON for comparison between commits:
+
+    python benchmarks/run_benchmarks.py --subjects 10 --channels 64 --duration 600 -o before.json
+    python benchmarks/run_benchmarks.py --subjects 10 --channels 64 --duration 600 -o after.json --compare before.json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import subprocess
+import tracemalloc
+import multiprocessing as mp
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SRC = os.path.join(os.path.dirname(HERE), "src")
+sys.path.insert(0, SRC)
+sys.path.insert(0, HERE)
+
+ROI = ["Pz", "P3", "P4"]
+RARE = [201, 202]
+WINDOW = (0.3, 0.6)
+
+
+def _first_vhdr(root):
+    from dataset_index import get_index
+    index = get_index(root)
+    return index.vhdr_path(index.subjects("visualoddball")[0], "visualoddball")
+
+
+# Each benchmark takes (data root, participants file). Benchmarks with a setup phase return
+# the time of the measured part only; the others are timed as a whole.
+def bench_load(root, participants_file):
+    import mne
+    mne.io.read_raw_brainvision(_first_vhdr(root), preload=True, verbose=False)
+
+
+def bench_filter(root, participants_file):
+    import mne
+    raw = mne.io.read_raw_brainvision(_first_vhdr(root), preload=True, verbose=False)
+    from Subjects import EegRecordSubject
+    start = time.perf_counter()
+    raw.filter(**EegRecordSubject.FILTER, verbose=False)
+    return time.perf_counter() - start  # Time of the filter alone
+
+
+def _bench_filter_method(method):
+    def bench(root, participants_file):
+        import mne
+        import filtering
+        from Subjects import EegRecordSubject
+        raw = mne.io.read_raw_brainvision(_first_vhdr(root), preload=True, verbose=False)
+        start = time.perf_counter()
+        filtering.filter_raw(raw, method=method, **EegRecordSubject.FILTER)
+        return time.perf_counter() - start
+    return bench
+
+
+def bench_construct_roi(root, participants_file):
+    from Subjects import EegRecordSubject
+    EegRecordSubject(_first_vhdr(root), channels=ROI)
+
+
+def bench_construct(root, participants_file):
+    from Subjects import EegRecordSubject
+    EegRecordSubject(_first_vhdr(root))
+
+
+def bench_find_amp_diff(root, participants_file):
+    from Subjects import EegRecordSubject
+    record = EegRecordSubject(_first_vhdr(root))
+    start = time.perf_counter()
+    record.find_amp_diff_2(ROI, RARE, *WINDOW)
+    return time.perf_counter() - start  # Time of the query alone
+
+
+def bench_lazy_find_amp_diff(root, participants_file):
+    from Subjects import EegRecordSubject
+    EegRecordSubject(_first_vhdr(root), lazy=True).find_amp_diff_2(ROI, RARE, *WINDOW)
+
+
+def bench_cached_construct(root, participants_file):
+    from Subjects import EegRecordSubject
+    from filter_cache import FilteredRawCache
+    cache = FilteredRawCache(os.path.join(root, ".cache"))
+    EegRecordSubject(_first_vhdr(root), cache=cache)  # Fill the cache
+    start = time.perf_counter()
+    EegRecordSubject(_first_vhdr(root), cache=cache)
+    return time.perf_counter() - start  # Time of the cache hit alone
+
+
+def bench_epoch_once_sweep(root, participants_file):
+    from Subjects import EegRecordSubject
+    record = EegRecordSubject(_first_vhdr(root))
+    start = time.perf_counter()
+    windows = [(t / 100, t / 100 + 0.1) for t in range(0, 70, 5)]
+    record.epoch_once(ROI).query([(ROI, RARE, a, b) for a, b in windows])
+    return time.perf_counter() - start
+
+
+def bench_epoch_store_sweep(root, participants_file):
+    from epoch_store import EpochStore
+    store = EpochStore(os.path.join(root, ".epochs"))
+    entry = store.update(_first_vhdr(root), ROI)  # Build the entry
+    start = time.perf_counter()
+    windows = [(t / 100, t / 100 + 0.1) for t in range(0, 70, 5)]
+    store.load(entry).query([(ROI, RARE, a, b) for a, b in windows])
+    return time.perf_counter() - start  # Time of the load + queries alone
+
+
+def bench_cohort(root, participants_file):
+    import amp_funcs as af
+    af.get_amp_diff_data(root, ROI, RARE, *WINDOW, participants_file=participants_file)
+
+
+def bench_cohort_prefetch(root, participants_file):
+    import amp_funcs as af
+    af.get_amp_diff_data(root, ROI, RARE, *WINDOW, participants_file=participants_file, prefetch=2)
+
+
+def bench_cohort_parallel(root, participants_file):
+    import cohort_runner as cr
+    cr.get_amp_diff_data_parallel(root, ROI, RARE, *WINDOW, participants_file=participants_file)
+
+
+BENCHMARKS = {
+    "load": bench_load,
+    "filter": bench_filter,
+    "filter_fft": _bench_filter_method("fft"),
+    "filter_iir": _bench_filter_method("iir"),
+    "construct": bench_construct,
+    "construct_roi": bench_construct_roi,
+    "find_amp_diff_2": bench_find_amp_diff,
+    "lazy_find_amp_diff_2": bench_lazy_find_amp_diff,
+    "cached_construct": bench_cached_construct,
+    "epoch_once_sweep": bench_epoch_once_sweep,
+    "epoch_store_sweep": bench_epoch_store_sweep,
+    "cohort": bench_cohort,
+    "cohort_prefetch": bench_cohort_prefetch,
+    "cohort_parallel": bench_cohort_parallel,
+}
+
+
+def _peak_rss_mb(who="self"):
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF if who == "self" else resource.RUSAGE_CHILDREN).ru_maxrss
+        return peak / 1024 ** 2 if sys.platform == "darwin" else peak / 1024  # bytes on macOS, KiB on Linux
+    try:
+        import psutil
+    except ImportError:
+        return None
+    if who != "self":
+        return None
+    info = psutil.Process().memory_info()
+    return getattr(info, "peak_wset", info.rss) / 1024 ** 2
+
+
+def _child(name, root, participants_file, queue):
+    import io
+    import contextlib
+    os.environ["MNE_LOGGING_LEVEL"] = "ERROR"  # Also silences the workers of the parallel runner
+    import mne
+    mne.set_log_level("ERROR")
+    # Import what the benchmark needs before measuring, so import cost is not counted
+    import Subjects, amp_funcs, cohort_runner, filter_cache, filtering  # noqa: F401
+    import scipy.signal  # noqa: F401
+
+    base_rss = _peak_rss_mb()
+    tracemalloc.start()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        inner = BENCHMARKS[name](root, participants_file)
+    wall = time.perf_counter() - start
+    _, traced_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    queue.put({
+        "wall_s": inner if inner is not None else wall,
+        "total_s": wall,
+        "peak_rss_mb": None if base_rss is None else _peak_rss_mb() - base_rss,
+        "peak_rss_workers_mb": _peak_rss_mb("children"),  # Largest worker process, if any
+        "peak_traced_mb": traced_peak / 1024 ** 2,
+    })
+
+
+def run_one(name, root, participants_file):
+    ctx = mp.get_context("spawn")
+    queue = ctx.Queue()
+    proc = ctx.Process(target=_child, args=(name, root, participants_file, queue))
+    proc.start()
+    result = queue.get()
+    proc.join()
+    return result
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=HERE, text=True).strip()
+    except Exception:
+        return None
+
+
+def compare(results, baseline_path, threshold):
+    """
+    Prints the time ratio of every benchmark against a baseline JSON and returns the regressions.
+    """
+    with open(baseline_path) as f:
+        baseline = {r["name"]: r for r in json.load(f)["results"]}
+    regressions = []
+    for r in results:
+        old = baseline.get(r["name"])
+        if old is None:
+            continue
+        ratio = r["wall_s"] / old["wall_s"] if old["wall_s"] else float("inf")
+        flag = "REGRESSION" if ratio > 1 + threshold else ""
+        print(f"{r['name']:<24} {old['wall_s']:9.3f}s -> {r['wall_s']:9.3f}s  x{ratio:5.2f}  {flag}")
+        if flag:
+            regressions.append(r["name"])
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--subjects", type=int, default=4)
+    parser.add_argument("--channels", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=300.0, help="seconds per recording")
+    parser.add_argument("--sfreq", type=float, default=500.0)
+    parser.add_argument("--event-rate", type=float, default=1.0, help="events per second")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per benchmark, the median is reported")
+    parser.add_argument("--only", nargs="*", choices=sorted(BENCHMARKS), help="run only these benchmarks")
+    parser.add_argument("--data-dir", help="reuse/keep the synthetic dataset in this folder")
+    parser.add_argument("-o", "--output", default="bench_results.json")
+    parser.add_argument("--compare", help="baseline JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="slowdown ratio flagged as regression")
+    args = parser.parse_args(argv)
+
+    import synthetic_dataset
+
+    params = {k: getattr(args, k) for k in ("subjects", "channels", "duration", "sfreq", "event_rate")}
+    with tempfile.TemporaryDirectory() as tmp:
+        root = args.data_dir or tmp
+        participants_file = os.path.join(root, "participants.xlsx")
+        if not os.path.exists(participants_file):
+            print(f"Writing synthetic dataset to {root}")
+            synthetic_dataset.make_dataset(root, n_subjects=args.subjects, n_channels=args.channels,
+                                           duration=args.duration, sfreq=args.sfreq, event_rate=args.event_rate)
+
+        results = []
+        for name in args.only or BENCHMARKS:
+            runs = [run_one(name, root, participants_file) for _ in range(args.repeat)]
+            walls = sorted(r["wall_s"] for r in runs)
+            result = {
+                "name": name,
+                "wall_s": walls[len(walls) // 2],
+                "runs": runs,
+                "peak_rss_mb": max((r["peak_rss_mb"] for r in runs if r["peak_rss_mb"] is not None),
+                                   default=None),
+                "peak_rss_workers_mb": max((r["peak_rss_workers_mb"] for r in runs
+                                            if r["peak_rss_workers_mb"] is not None), default=None),
+                "peak_traced_mb": max(r["peak_traced_mb"] for r in runs),
+            }
+            results.append(result)
+            rss = "n/a" if result["peak_rss_mb"] is None else f"{result['peak_rss_mb']:.1f} MB"
+            print(f"{name:<24} {result['wall_s']:9.3f}s  rss {rss:>10}  traced {result['peak_traced_mb']:8.1f} MB")
+
+    import numpy
+    import mne
+    report = {
+        "meta": {"commit": _git_commit(), "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                 "python": platform.python_version(), "numpy": numpy.__version__, "mne": mne.__version__,
+                 "platform": platform.platform(), "cpu_count": os.cpu_count(), "params": params},
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.compare:
+        return 1 if compare(results, args.compare, args.threshold) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
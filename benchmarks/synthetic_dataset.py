@@ -0,0 +1,97 @@
+import os
+import numpy as np
+import pandas as pd
+
+# 10-20 names first, so the ROIs used by the analysis scripts always exist
+STANDARD_CHANNELS = ["Fp1", "Fp2", "F7", "F3", "Fz", "F4", "F8", "FC5", "FC1", "FC2", "FC6", "T7", "C3",
+                     "Cz", "C4", "T8", "CP5", "CP1", "CP2", "CP6", "P7", "P3", "Pz", "P4", "P8", "PO9",
+                     "O1", "Oz", "O2", "PO10", "AF7", "AF3", "AF4", "AF8", "F5", "F1", "F2", "F6"]
+
+RARE_EVENTS = [201, 202]
+FREQUENT_EVENTS = [11, 12, 13]
+
+
+def channel_names(n_channels: int):
+    extra = [f"E{i}" for i in range(1, max(n_channels - len(STANDARD_CHANNELS), 0) + 1)]
+    return (STANDARD_CHANNELS + extra)[:n_channels]
+
+
+def write_recording(folder: str, base_name: str, n_channels=32, duration=300.0, sfreq=500.0,
+                    event_rate=1.0, rare_ratio=0.2, seed=0):
+    """
+    Writes one synthetic BrainVision recording (.vhdr, .vmrk and float32 multiplexed .eeg).
+
+    The signal is white noise of about 10 uV with a P300-like bump after every rare event,
+    so amplitude differences have a known sign.
+
+    :return: Path to the .vhdr file.
+    """
+    rng = np.random.default_rng(seed)
+    os.makedirs(folder, exist_ok=True)
+    names = channel_names(n_channels)
+    n_samples = int(duration * sfreq)
+
+    # Events every 1/event_rate seconds on average, away from the recording edges
+    events = []
+    sample = int(sfreq)
+    while sample < n_samples - sfreq:
+        rare = rng.random() < rare_ratio
+        code = int(rng.choice(RARE_EVENTS if rare else FREQUENT_EVENTS))
+        events.append((sample, code))
+        sample += max(int(sfreq / event_rate * rng.uniform(0.8, 1.2)), 1)
+
+    bump = np.hanning(int(0.3 * sfreq)).astype(np.float32) * 5
+    eeg_path = os.path.join(folder, base_name + ".eeg")
+    chunk = int(60 * sfreq)  # Write in chunks so long recordings don't need the full array in memory
+    with open(eeg_path, "wb") as f:
+        for start in range(0, n_samples, chunk):
+            stop = min(start + chunk, n_samples)
+            data = rng.standard_normal((stop - start, n_channels), dtype=np.float32) * 10
+            for onset, code in events:
+                if code in RARE_EVENTS and start <= onset + int(0.3 * sfreq) and onset + int(0.6 * sfreq) <= stop:
+                    at = onset + int(0.3 * sfreq) - start
+                    data[at:at + len(bump)] += bump[:, np.newaxis]
+            data.astype("<f4").tofile(f)
+
+    with open(os.path.join(folder, base_name + ".vhdr"), "w", encoding="utf-8") as f:
+        f.write("Brain Vision Data Exchange Header File Version 1.0\n\n[Common Infos]\nCodepage=UTF-8\n")
+        f.write(f"DataFile={base_name}.eeg\nMarkerFile={base_name}.vmrk\nDataFormat=BINARY\n")
+        f.write(f"DataOrientation=MULTIPLEXED\nNumberOfChannels={n_channels}\n")
+        f.write(f"SamplingInterval={1e6 / sfreq:g}\n\n[Binary Infos]\nBinaryFormat=IEEE_FLOAT_32\n\n")
+        f.write("[Channel Infos]\n")
+        for i, name in enumerate(names, 1):
+            f.write(f"Ch{i}={name},,1,µV\n")
+
+    with open(os.path.join(folder, base_name + ".vmrk"), "w", encoding="utf-8") as f:
+        f.write("Brain Vision Data Exchange Marker File, Version 1.0\n\n[Common Infos]\nCodepage=UTF-8\n")
+        f.write(f"DataFile={base_name}.eeg\n\n[Marker Infos]\nMk1=New Segment,,1,1,0\n")
+        for i, (onset, code) in enumerate(events, 2):
+            f.write(f"Mk{i}=Stimulus,S{code:3d},{onset + 1},1,0\n")
+
+    return os.path.join(folder, base_name + ".vhdr")
+
+
+def make_dataset(root: str, n_subjects=10, n_channels=32, duration=300.0, sfreq=500.0, event_rate=1.0,
+                 tasks=("visualoddball",)):
+    """
+    Writes a synthetic BIDS-style dataset (`sub-XXX/eeg/sub-XXX_task-<task>_eeg.*`) and a
+    matching participants.xlsx, and returns the path of the participants table.
+    """
+    for i in range(1, n_subjects + 1):
+        sub = f"sub-{i:03}"
+        for t, task in enumerate(tasks):
+            write_recording(os.path.join(root, sub, "eeg"), f"{sub}_task-{task}_eeg", n_channels=n_channels,
+                            duration=duration, sfreq=sfreq, event_rate=event_rate, seed=i * 100 + t)
+
+    rng = np.random.default_rng(0)
+    participants = pd.DataFrame({
+        "participant_id": [f"sub-{i:03}" for i in range(1, n_subjects + 1)],
+        "Gender": rng.choice(["F", "M"], n_subjects),
+        "Age": np.round(rng.uniform(18, 30, n_subjects), 2),
+        "Highest_Edu": rng.choice(["High school", "Bachelor", "Master"], n_subjects),
+        "Highest_Adult_Edu_Nb": rng.integers(10, 20, n_subjects).astype(float),
+        "Income_Household": rng.choice(["less than $5,000", "50,000 - 59,999", "100,000 - 149,999"], n_subjects),
+    })
+    participants_file = os.path.join(root, "participants.xlsx")
+    participants.to_excel(participants_file, index=False)
+    return participants_file
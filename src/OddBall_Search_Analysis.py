@@ -1,24 +1,26 @@
-import amp_funcs as af
-import pandas as pd
-from Subjects import Participant
-import matplotlib.pyplot as plt
+import cohort_runner as cr
+from checkpoint import CohortCheckpoint
 """
 Script that create data for specific task and store it in excel file.
- It get all participants objects using "get_amp_diff_data_VS" and store the data
+ Results are streamed into a checkpoint database while the cohort runs, so an
+ interrupted run resumes where it stopped. The excel file is exported at the end.
 """
 
 path = r"src\rodata"
+task = "visualsearch"
+channels, events, tmin, tmax = ["Fz", "F3", "F4", "FC1", "FC2", "C3", "C4"], [201, 202], 0.125, 0.225
 
-participants = af.get_amp_diff_data_VS(path, ["Fz", "F3", "F4", "FC1", "FC2", "C3", "C4"], [201, 202], 0.125, 0.225)
+export_excel = True
+# Subjects processed in parallel. Each worker process holds a whole filtered recording in
+# memory; raise it on machines with enough RAM (None uses every CPU core).
+n_workers = 2
 
-data = {
-    'Gender': [p.gender for p in participants],
-    'Age': [p.age for p in participants],
-    'Highest_Edu': [p.highest_edu for p in participants],
-    'Highest_Adult_Edu': [p.highest_adult_edu for p in participants],
-    'Income_Household': [p.income_household for p in participants],
-    'amp_diff': [p.amp_diff for p in participants],
-}
-df = pd.DataFrame(data)
-df.to_excel("output_fz.xlsx", index=False)
+if __name__ == "__main__":
+    checkpoint = CohortCheckpoint("output_fz.sqlite")
 
+    for result in cr.iter_cohort(path, channels, events, tmin, tmax, checkpoint, task=task, n_workers=n_workers):
+        print(result)
+
+    if export_excel:
+        checkpoint.to_excel("output_fz.xlsx", task, cr.run_params_key(channels, events, tmin, tmax, task))
+    checkpoint.close()
@@ -1,19 +1,58 @@
+import os
 import numpy as np
 import mne
 import pandas as pd
+from epoch_engine import EpochedRecord
+from lazy_record import LazyEegData
+from brainvision import read_events
+import profiling
+import filtering
 
 class EegRecordSubject:
-    def __init__(self, file_path: str):
+    # Band-pass filter applied to every record
+    FILTER = dict(l_freq=0.1, h_freq=40, fir_design='firwin')
+
+    def __init__(self, file_path: str, cache=None, lazy=False, filter_method="mne", channels=None):
         """
         Initializes the EEG record subject by loading the BrainVision EEG data.
 
         :param file_path: Path to the .vhdr file (the header file).
+        :param cache: Optional `FilteredRawCache`. When given, the filtered data is taken from
+                      (or stored to) the cache instead of being filtered again.
+        :param lazy: If True, only the header and markers are loaded. The .eeg file is
+                     memory-mapped and each query reads and filters only the channels and
+                     event-locked segments it needs. `raw` then holds the unfiltered,
+                     not preloaded recording. `find_amp_diff_2` keeps only one mean per
+                     epoch and channel. Its peak memory is about one padded chunk of the
+                     picked channels going through the filter, whatever the length and
+                     width of the recording, so the saving grows with the recording size.
+        :param filter_method: Filtering engine, see `filtering.METHODS`. "mne" (the default) is
+                              `raw.filter`; "fft" gives the same output faster; "iir" is an
+                              approximation, check it with `filtering.check_accuracy`.
+        :param channels: If given, only these channels are kept and filtered. Queries on other
+                         channels then fail. Ignored in lazy mode, which reads only what it needs.
         """
 
         self.file_path = file_path
+        self.lazy_data = None
         #Try to create the attributes of the eeg record
         try:
-            self.raw = mne.io.read_raw_brainvision(self.file_path, preload=True)
+            if lazy:
+                with profiling.stage("read"):
+                    self.raw = mne.io.read_raw_brainvision(self.file_path, preload=False)
+                    self.lazy_data = LazyEegData(self.file_path, **self.FILTER, method=filter_method)
+            elif cache is not None:
+                with profiling.stage("cache") as stage:
+                    self.raw = cache.load(self.file_path, **self.FILTER, method=filter_method)
+                    stage.add_bytes(self.raw._data.nbytes)
+                if channels is not None:
+                    self.raw.pick(list(channels))
+            else:
+                with profiling.stage("read") as stage:
+                    self.raw = mne.io.read_raw_brainvision(self.file_path, preload=True)
+                    stage.add_bytes(sum(os.path.getsize(f) for f in self.raw.filenames))
+                if channels is not None:
+                    self.raw.pick(list(channels))
             print("EEG data successefully uploaded")
         except FileNotFoundError:
             print("File did not found")
@@ -23,13 +62,45 @@ class EegRecordSubject:
             self.raw = None
         
         if self.raw:
-            #filtring data
-            self.raw.filter(0.1, 40, fir_design='firwin')
+            if cache is None and not lazy:
+                #filtring data
+                with profiling.stage("filter", nbytes=self.raw._data.nbytes):
+                    filtering.filter_raw(self.raw, method=filter_method, **self.FILTER)
             self.channels = self.raw.ch_names
-            self.events, self.event_id = mne.events_from_annotations(self.raw)
+            with profiling.stage("events"):
+                self.events, self.event_id = self._read_events()
         else:
             self.channels = None
 
+    @classmethod
+    def from_raw(cls, raw, file_path=None, events=None, event_id=None):
+        """
+        Creates a record around an already loaded and filtered `Raw`, without reading the file.
+
+        :param raw: The filtered recording, e.g. attached from shared memory.
+        :param file_path: Path to the .vhdr file the recording comes from.
+        :param events, event_id: Events of the recording. If not given, they are read from
+                                 the marker file, or from the annotations of `raw`.
+        """
+        record = cls.__new__(cls)
+        record.file_path = file_path
+        record.lazy_data = None
+        record.raw = raw
+        record.channels = raw.ch_names
+        if events is None:
+            record.events, record.event_id = record._read_events()
+        else:
+            record.events, record.event_id = events, event_id
+        return record
+
+    def _read_events(self):
+        # The native marker parser gives the same events as MNE, without building annotations
+        try:
+            markers = read_events(self.file_path)
+            return markers["events"], markers["event_id"]
+        except Exception:
+            return mne.events_from_annotations(self.raw)
+
     def display(self, n_channels = 31, picks = None, scalings = 'auto', events = None):
         # Get the sampling rate (Hz)
         sampling_rate = self.raw.info['sfreq']
@@ -73,35 +144,80 @@ class EegRecordSubject:
         - The returned value is `mean_rare - mean_freq`, representing the difference in response.
 
         """
-        # Extract event IDs for all epochs
-        epochs = mne.Epochs(self.raw, events = self.events, event_id = self.event_id,
-                          tmin = -0.2, tmax = 0.8, picks = channels, baseline = (None, 0))
-        
-        # Create masks to separate rare and frequent events
-        epoch_event_ids = epochs.events[:, 2]
-        mask_rare = np.isin(epoch_event_ids, rare_events)
-        rare_epochs = epochs[mask_rare]   # Contains only rare event epochs
-        freq_epochs = epochs[~mask_rare]  # Contains all other epochs
+        if self.lazy_data is not None:
+            # Every epoch is reduced to its window mean while its chunk is filtered; the mean
+            # of those equals the mean over epochs and samples computed below
+            with profiling.stage("epoch"):
+                means, events, _ = self._lazy_epochs(channels, window=(tmin, tmax))
+            mask_rare = np.isin(events[:, 2], rare_events)
+            return np.mean(np.mean(means[mask_rare], axis=0)) - np.mean(np.mean(means[~mask_rare], axis=0))
+        else:
+            # Extract event IDs for all epochs
+            with profiling.stage("epoch"):
+                epochs = mne.Epochs(self.raw, events = self.events, event_id = self.event_id,
+                                  tmin = -0.2, tmax = 0.8, picks = channels, baseline = (None, 0))
+
+            # Create masks to separate rare and frequent events
+            epoch_event_ids = epochs.events[:, 2]
+            mask_rare = np.isin(epoch_event_ids, rare_events)
+            with profiling.stage("get_data") as stage:
+                rare_data = epochs[mask_rare].get_data()   # Contains only rare event epochs
+                freq_data = epochs[~mask_rare].get_data()  # Contains all other epochs
+                stage.add_bytes(rare_data.nbytes + freq_data.nbytes)
+            times = epochs.times
+            sfreq = epochs.info["sfreq"]
 
         # Convert time window to sample indices
         time_range = (tmin, tmax)
-        sfreq = epochs.info["sfreq"]
-        tmin_idx = int((time_range[0] - epochs.times[0]) * sfreq)
-        tmax_idx = int((time_range[1] - epochs.times[0]) * sfreq)
+        tmin_idx = int((time_range[0] - times[0]) * sfreq)
+        tmax_idx = int((time_range[1] - times[0]) * sfreq)
 
         # Compute mean amplitude for rare and frequent epochs
-        mean_rare = np.mean(rare_epochs.get_data()[:, :, tmin_idx:tmax_idx+1], axis=(0, 2))
+        mean_rare = np.mean(rare_data[:, :, tmin_idx:tmax_idx+1], axis=(0, 2))
         mean_rare = np.mean(mean_rare)
-        mean_freq = np.mean(freq_epochs.get_data()[:, :, tmin_idx:tmax_idx+1], axis=(0, 2))
+        mean_freq = np.mean(freq_data[:, :, tmin_idx:tmax_idx+1], axis=(0, 2))
         mean_freq = np.mean(mean_freq)
 
         return mean_rare - mean_freq
 
+    def epoch_once(self, channels):
+        """
+        Epochs the record a single time over `channels` for repeated amplitude queries.
+
+        Use this instead of calling `find_amp_diff_2` in a loop when sweeping channel sets,
+        time windows or rare event definitions on the same record.
+
+        :param channels: Union of all the channels that will be queried.
+        :return: An `EpochedRecord` whose `query` method answers many
+                 (channels, rare_events, tmin, tmax) queries in one pass.
+        """
+        if self.lazy_data is not None:
+            channels = list(dict.fromkeys(channels))
+            with profiling.stage("epoch"):
+                data, events, times = self._lazy_epochs(channels)
+            return EpochedRecord(data, events[:, 2], times, self.lazy_data.sfreq, channels)
+        with profiling.stage("epoch"):
+            return EpochedRecord.from_raw(self.raw, self.events, self.event_id, channels)
+
+    def _lazy_epochs(self, channels, tmin=-0.2, tmax=0.8, window=None):
+        # Same epochs as mne.Epochs(..., baseline=(None, 0)) on the filtered recording
+        bad_segments = [
+            (self.raw.time_as_index(a["onset"], use_rounding=True)[0],
+             self.raw.time_as_index(a["onset"] + a["duration"], use_rounding=True)[0])
+            for a in self.raw.annotations if a["description"].lower().startswith("bad")
+        ]
+        return self.lazy_data.get_epochs(channels, self.events, tmin, tmax, baseline=(None, 0),
+                                         first_samp=self.raw.first_samp, bad_segments=bad_segments,
+                                         window=window)
+
 
 
         
          
 class Participant:
+    # Fixed attributes, no per-instance __dict__ (see ParticipantTable for columnar storage)
+    __slots__ = ("gender", "age", "highest_edu", "highest_adult_edu", "income_household", "amp_diff")
+
     def __init__(self, gender: str, age: float, highest_edu: str, highest_adult_edu: float, income_household: str, amp_diff: float):
         self.gender = gender
         self.age = age
@@ -1,33 +1,39 @@
-import amp_funcs as af
-import pandas as pd
-from Subjects import Participant
+import cohort_runner as cr
+from checkpoint import CohortCheckpoint
 import matplotlib.pyplot as plt
 
 """
 Script that create data for specific task and store it in excel file.
- It get all participants objects using "get_amp_diff_data_VS" and store the data
+ Results are streamed into a checkpoint database while the cohort runs, so an
+ interrupted run resumes where it stopped. The excel file is exported at the end.
 """
 
 path = r"src\rodata"
+task = "visualoddball"
+channels, events, tmin, tmax = ["Pz", "P3", "P4"], [201, 202], 0.3, 0.6
 
-participants = af.get_amp_diff_data(path, ["Pz", "P3", "P4"], [201, 202], 0.3, 0.6)
+export_excel = True
+# Subjects processed in parallel. Each worker process holds a whole filtered recording in
+# memory; raise it on machines with enough RAM (None uses every CPU core).
+n_workers = 2
 
-data = {
-    'Gender': [p.gender for p in participants],
-    'Age': [p.age for p in participants],
-    'Highest_Edu': [p.highest_edu for p in participants],
-    'Highest_Adult_Edu': [p.highest_adult_edu for p in participants],
-    'Income_Household': [p.income_household for p in participants],
-    'amp_diff': [p.amp_diff for p in participants],
-}
-df = pd.DataFrame(data)
-df.to_excel("output_p3b.xlsx", index=False)
+if __name__ == "__main__":
+    checkpoint = CohortCheckpoint("output_p3b.sqlite")
 
-df.plot(kind="scatter", x = "Highest_Adult_Edu", y = "amp_diff", alpha = 0.5, color = 'blue',
-        figsize=(10,6))
+    for result in cr.iter_cohort(path, channels, events, tmin, tmax, checkpoint, task=task, n_workers=n_workers):
+        print(result)
 
-plt.xlabel('Parent Education Level')
-plt.ylabel('Amplitude Difference')
-plt.title('Amplitude Difference vs Parent Education Level')
+    df = checkpoint.to_dataframe(task, cr.run_params_key(channels, events, tmin, tmax, task))
+    checkpoint.close()
 
-plt.show()
+    if export_excel:
+        df.drop(columns="subject").to_excel("output_p3b.xlsx", index=False)
+
+    df.plot(kind="scatter", x = "Highest_Adult_Edu", y = "amp_diff", alpha = 0.5, color = 'blue',
+            figsize=(10,6))
+
+    plt.xlabel('Parent Education Level')
+    plt.ylabel('Amplitude Difference')
+    plt.title('Amplitude Difference vs Parent Education Level')
+
+    plt.show()
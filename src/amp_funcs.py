@@ -1,10 +1,30 @@
-import os
-import pandas as pd
+import numpy as np
 from Subjects import EegRecordSubject
 from Subjects import Participant
+from dataset_index import PARTICIPANTS_FILE, get_index
+from brainvision import read_events
+from prefetch import PrefetchLoader
+import profiling
 
 
-def get_amp_diff_data(path: str, channels, events_to_check, tmin: float, tmax: float, max_files=0):
+def participant_from_row(row, amp_diff):
+    """
+    Creates a `Participant` from a row of the participants table and the amplitude
+    difference extracted from the participant's EEG record.
+    """
+    return Participant(
+        gender=row["Gender"],
+        age=float(row["Age"]),
+        highest_edu=row["Highest_Edu"],
+        highest_adult_edu=float(row["Highest_Adult_Edu_Nb"]),
+        income_household=row["Income_Household"],
+        amp_diff=amp_diff
+    )
+
+
+def get_amp_diff_data(path: str, channels, events_to_check, tmin: float, tmax: float, max_files=0, cache=None,
+                      task="visualoddball", participants_file=PARTICIPANTS_FILE, filter_method="mne",
+                      prefetch=0, prefetch_bytes=None):
     """
     Processes EEG data for a visual oddball task, extracts amplitude differences, and associates them 
     with participant metadata.
@@ -19,98 +39,117 @@ def get_amp_diff_data(path: str, channels, events_to_check, tmin: float, tmax: f
         events_to_check (list[str]): List of event markers to extract epochs from.
         tmin (float): Start time (in seconds) of the epoch relative to the event.
         tmax (float): End time (in seconds) of the epoch relative to the event.
-        max_files (int, optional): The maximum number of participants to process. 
+        max_files (int, optional): The highest subject number to process.
                                    If 0, processes all available participants.
+        cache (FilteredRawCache, optional): Cache of filtered recordings passed to `EegRecordSubject`.
+        task (str, optional): Task name as it appears in the file names. Default is "visualoddball".
+        participants_file (str, optional): Path to the participants demographic table.
+        filter_method (str, optional): Filtering engine, see `filtering.METHODS`. Default is "mne".
+        prefetch (int, optional): Number of recordings read ahead in a background thread while
+                                  the current one is filtered and epoched (see `PrefetchLoader`).
+                                  If 0 (default), every recording is read when it is processed.
+                                  Not used with `cache`.
+        prefetch_bytes (int, optional): Cap on the .eeg bytes held by the read-ahead recordings.
 
     Returns:
         list[Participant]: A list of `Participant` objects, each containing demographic data 
                            and the extracted amplitude difference.
 
     Notes:
-        - The function reads participant demographic data from "src/participants.xlsx".
-        - The EEG recordings are expected to be in `sub-XXX/eeg/sub-XXX_task-visualoddball_eeg.vhdr` format.
-        - If a participant’s EEG file is missing or processing fails, an error is printed, and they are skipped.
+        - The function reads participant demographic data from "src/participants.xlsx" and matches
+          it to the recordings by participant ID (`sub-XXX`).
+        - The EEG recordings are expected to be in `sub-XXX/eeg/sub-XXX_task-<task>_eeg.vhdr` format.
+          They are found with the cached `DatasetIndex` of `path`.
+        - If processing of a participant fails, an error is printed, and they are skipped.
+        - Only `channels` are filtered, which gives the same values as filtering every channel.
+        - When profiling is enabled (`profiling.enable()`), every subject's stages are recorded.
+        - With `prefetch`, the overlap achieved between reads and processing is printed at the end.
     """
-    df = pd.read_excel(r"src\participants.xlsx")
-    
-    # If max_files is not specified, use the number of participants in the dataset
-    if max_files == 0:
-        max_files = len(df)
+    index = get_index(path, participants_file)
 
     participants = []
 
-    for i in range(1, max_files + 1):
-        file_path = os.path.join(path, f"sub-{i:03}\eeg\sub-{i:03}_task-visualoddball_eeg.vhdr")
-        
-        if os.path.exists(file_path):
-            try:
-                # Create an EEG record object and extract amplitude differences
-                eeg_r = EegRecordSubject(file_path)
+    subjects = index.subjects(task, max_files)
+    loader = None
+    if prefetch and cache is None:
+        loader = PrefetchLoader([index.vhdr_path(i, task) for i in subjects], depth=prefetch,
+                                max_bytes=prefetch_bytes)
+        recordings = iter(loader)
+
+    for i in subjects:
+        file_path = index.vhdr_path(i, task)
+        try:
+            # Create an EEG record object and extract amplitude differences
+            with profiling.subject(i):
+                if loader is None:
+                    eeg_r = EegRecordSubject(file_path, cache=cache, filter_method=filter_method, channels=channels)
+                else:
+                    with profiling.stage("read"):
+                        _, recording, error = next(recordings)
+                    if error is not None:
+                        raise error
+                    eeg_r = recording.to_record(channels, filter_method)
                 amp_diff = eeg_r.find_amp_diff_2(channels, events_to_check, tmin, tmax)
 
-                # Retrieve participant metadata from the Excel file
-                row = df.iloc[i]  # Assuming row i corresponds to participant i
-                
-                participant = Participant(
-                    gender=row["Gender"],
-                    age=float(row["Age"]),
-                    highest_edu=row["Highest_Edu"],
-                    highest_adult_edu=float(row["Highest_Adult_Edu_Nb"]),
-                    income_household=row["Income_Household"],
-                    amp_diff=amp_diff
-                )
+            # Retrieve participant metadata by participant ID
+            participant = participant_from_row(index.participant(i), amp_diff)
 
-                participants.append(participant)
+            participants.append(participant)
 
-            except Exception as e:
-                print(f"Failed to load {file_path}: {e}")
+        except Exception as e:
+            print(f"Failed to load {file_path}: {e}")
+
+    if loader is not None:
+        print(loader.summary())
 
     return participants
 
 
-def get_amp_diff_data_VS(path: str, channels, events_to_check, tmin: int, tmax: int, max_files=0):
+def get_amp_diff_data_VS(path: str, channels, events_to_check, tmin: int, tmax: int, max_files=0, cache=None,
+                         participants_file=PARTICIPANTS_FILE, filter_method="mne", prefetch=0, prefetch_bytes=None):
     """
     Similar to `get_amp_diff_data`, but processes EEG data for a visual search task.
 
     The function follows the same workflow as `get_amp_diff_data`, except it looks for EEG files 
-    associated with the "visual search" task.
+    associated with the "visual search" task. The other parameters are the same.
+    """
+    return get_amp_diff_data(path, channels, events_to_check, tmin, tmax, max_files=max_files,
+                             cache=cache, task="visualsearch", participants_file=participants_file,
+                             filter_method=filter_method, prefetch=prefetch, prefetch_bytes=prefetch_bytes)
 
-    Due to lack of time the function is not generic for task, but should added another argument called
-    'task' that can specify the task we checking to make the tools more generic and flexable
 
+def count_trials(path: str, rare_events, task="visualoddball", max_files=0):
     """
-    df = pd.read_excel(r"src\participants.xlsx")
-    
-    if max_files == 0:
-        max_files = len(df)
+    Counts the rare and frequent trials of every recording of a task, for QC and subject selection.
 
-    participants = []
-
-    for i in range(1, max_files + 1):
-        file_path = os.path.join(path, f"sub-{i:03}\eeg\sub-{i:03}_task-visualsearch_eeg.vhdr")
+    Only the .vhdr/.vmrk files are parsed, the EEG data is never loaded, so this is fast
+    enough to run over the whole dataset before an analysis.
 
-        if os.path.exists(file_path):
-            try:
-                eeg_r = EegRecordSubject(file_path)
-                amp_diff = eeg_r.find_amp_diff_2(channels, events_to_check, tmin, tmax)
-                
-                row = df.iloc[i]  
+    Parameters:
+        path (str): The root directory containing the EEG data.
+        rare_events (list[int]): List of event IDs that are considered "rare" events.
+        task (str, optional): Task name as it appears in the file names. Default is "visualoddball".
+        max_files (int, optional): The highest subject number to check. If 0, checks all subjects.
 
-                participant = Participant(
-                    gender=row["Gender"],
-                    age=float(row["Age"]),
-                    highest_edu=row["Highest_Edu"],
-                    highest_adult_edu=float(row["Highest_Adult_Edu_Nb"]),
-                    income_household=row["Income_Household"],
-                    amp_diff=amp_diff
-                )
+    Returns:
+        dict: Subject number -> (number of rare events, number of other events).
 
-                participants.append(participant)
+    Notes:
+        - The counts are of markers; epochs that `find_amp_diff_2` drops at the edges of
+          the recording are still counted.
+    """
+    index = get_index(path)
+    counts = {}
 
-            except Exception as e:
-                print(f"Failed to load {file_path}: {e}")
+    for i in index.subjects(task, max_files):
+        try:
+            event_ids = read_events(index.vhdr_path(i, task))["events"][:, 2]
+            n_rare = int(np.isin(event_ids, rare_events).sum())
+            counts[i] = (n_rare, len(event_ids) - n_rare)
+        except Exception as e:
+            print(f"Failed to read events of subject {i}: {e}")
 
-    return participants
+    return counts
 
 
 def some_samples_p3b(path: str, channels, events_to_check, tmin: int, tmax: int, max_files=30):
@@ -132,16 +171,14 @@ def some_samples_p3b(path: str, channels, events_to_check, tmin: int, tmax: int,
         - This function does not return values; it prints the extracted amplitude differences.
         - Skips missing or unprocessable EEG records.
     """
+    index = get_index(path)
     records = []
 
-    for i in range(1, max_files + 1):
-        file_path = os.path.join(path, f"sub-{i:03}\eeg\sub-{i:03}_task-visualoddball_eeg.vhdr")
-
-        if os.path.exists(file_path):
-            try:
-                eeg_r = EegRecordSubject(file_path)
-                records.append(eeg_r.find_amp_diff(channels, events_to_check, tmin, tmax))
-            except Exception as e:
-                print(e)
+    for i in index.subjects("visualoddball", max_files):
+        try:
+            eeg_r = EegRecordSubject(index.vhdr_path(i, "visualoddball"))
+            records.append(eeg_r.find_amp_diff(channels, events_to_check, tmin, tmax))
+        except Exception as e:
+            print(e)
 
     print(records)
@@ -0,0 +1,203 @@
+import os
+import re
+import numpy as np
+
+# Scale of the BrainVision channel units to volts (MNE stores EEG in volts)
+UNIT_SCALES = {"": 1e-6, "v": 1.0, "mv": 1e-3, "µv": 1e-6, "μv": 1e-6, "uv": 1e-6, "nv": 1e-9}
+
+BINARY_DTYPES = {"IEEE_FLOAT_32": "<f4", "INT_16": "<i2", "INT_32": "<i4", "UINT_16": "<u2"}
+
+# Event code rules of mne.events_from_annotations(event_id="auto") for BrainVision files
+EVENT_OFFSETS = {"Event/": 0, "Stimulus/S": 0, "Response/R": 1000, "Optic/O": 2000}
+OTHER_MARKERS = {"New Segment/": 99999, "SyncStatus/Sync On": 99998}
+OTHER_OFFSET = 10001
+IGNORED_MARKERS = re.compile(r"^(?:[Bb][Aa][Dd]|[Ee][Dd][Gg][Ee])")
+
+
+def _codepage(raw: bytes):
+    codepage = re.search(rb"Codepage=(.+)", raw, re.IGNORECASE)
+    codepage = codepage.group(1).strip().decode("ascii", "ignore") if codepage else "utf-8"
+    return "cp1252" if codepage.upper() == "ANSI" else codepage
+
+
+def _decode(raw: bytes, codepage: str):
+    try:
+        return raw.decode(codepage)
+    except (UnicodeDecodeError, LookupError):
+        return raw.decode("latin-1")
+
+
+def _read_text(path: str):
+    with open(path, "rb") as f:
+        raw = f.read()
+    return _decode(raw, _codepage(raw))
+
+
+def _sections(text: str):
+    """
+    Splits a BrainVision header/marker file into {section: {key: value}}.
+    Comment lines (starting with ';') and the file identification line are skipped.
+    """
+    sections = {}
+    current = None
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line.startswith(";"):
+            continue
+        if line.startswith("[") and line.endswith("]"):
+            current = sections.setdefault(line[1:-1], {})
+        elif current is not None and "=" in line:
+            key, value = line.split("=", 1)
+            current[key.strip()] = value
+    return sections
+
+
+def read_vhdr(vhdr_path: str):
+    """
+    Reads the parts of a BrainVision .vhdr header needed to access the binary data directly.
+
+    Parameters:
+        vhdr_path (str): Path to the .vhdr file.
+
+    Returns:
+        dict: With the keys
+            - `sfreq` (float): Sampling rate in Hz.
+            - `ch_names` (list[str]): Channel names in file order.
+            - `cals` (list[float]): Per-channel factor from the stored values to volts.
+            - `data_file` / `marker_file` (str): Absolute paths of the .eeg and .vmrk files.
+            - `dtype` (str): NumPy dtype of the stored samples.
+            - `orientation` (str): "MULTIPLEXED" or "VECTORIZED".
+            - `n_samples` (int): Number of samples per channel, derived from the .eeg size.
+
+    Notes:
+        - Only binary data files are supported; ASCII exports raise `ValueError`.
+        - The .eeg file is only stat-ed, never read.
+    """
+    sections = _sections(_read_text(vhdr_path))
+    common = sections.get("Common Infos", {})
+    binary = sections.get("Binary Infos", {})
+    directory = os.path.dirname(os.path.abspath(vhdr_path))
+
+    if common.get("DataFormat", "BINARY").upper() != "BINARY":
+        raise ValueError(f"Only binary BrainVision data is supported, got {common.get('DataFormat')}")
+    binary_format = binary.get("BinaryFormat", "").strip().upper()
+    if binary_format not in BINARY_DTYPES:
+        raise ValueError(f"Unsupported BinaryFormat {binary_format!r}")
+
+    n_channels = int(common["NumberOfChannels"])
+    ch_names, cals = [], []
+    channels = sections.get("Channel Infos", {})
+    for i in range(1, n_channels + 1):
+        props = channels[f"Ch{i}"].split(",")
+        props += [""] * (4 - len(props))
+        name, _, resolution, unit = props[:4]
+        ch_names.append(name.replace("\\1", ","))
+        resolution = float(resolution) if resolution.strip() else 1.0
+        cals.append(resolution * UNIT_SCALES.get(unit.strip().lower(), 1e-6))
+
+    data_file = os.path.join(directory, common["DataFile"].strip())
+    marker_file = common.get("MarkerFile")
+    dtype = BINARY_DTYPES[binary_format]
+    itemsize = int(dtype[-1])
+
+    return {
+        "sfreq": 1e6 / float(common["SamplingInterval"]),
+        "ch_names": ch_names,
+        "cals": cals,
+        "data_file": data_file,
+        "marker_file": os.path.join(directory, marker_file.strip()) if marker_file else None,
+        "dtype": dtype,
+        "orientation": common.get("DataOrientation", "MULTIPLEXED").strip().upper(),
+        "n_samples": os.path.getsize(data_file) // (itemsize * n_channels),
+    }
+
+
+def read_vmrk(vmrk_path: str):
+    """
+    Reads the markers of a BrainVision .vmrk file.
+
+    Parameters:
+        vmrk_path (str): Path to the .vmrk file.
+
+    Returns:
+        list[tuple]: (sample, duration, description) of every marker, with 0-based samples and
+                     descriptions formatted like MNE annotations ("Stimulus/S201"). The first
+                     "New Segment" marker is skipped, as MNE does.
+    """
+    return _parse_markers(_read_text(vmrk_path))
+
+
+def _parse_marker(info: str):
+    """
+    Parses the value of a `MkN=` line into (onset sample, duration, "type/description").
+    """
+    fields = info.strip("\r").split(",")
+    mtype, mdesc, onset, duration = fields[:4]
+    mtype = mtype.replace("\\1", ",")
+    mdesc = mdesc.replace("\\1", ",")
+    duration = int(duration) if duration.isdigit() else 0
+    return int(onset) - 1, duration, f"{mtype}/{mdesc}"
+
+
+def _parse_markers(text: str):
+    start = re.search(r"\[Marker Infos\]", text, re.IGNORECASE)
+    if not start:
+        return []
+    text = text[start.end():]
+    end = re.search(r"^\[.*\]", text, re.MULTILINE)
+    if end:
+        text = text[:end.start()]
+
+    markers = [_parse_marker(info) for info in re.findall(r"^Mk\d+=(.*)", text, re.MULTILINE)]
+    if markers and markers[0][2].startswith("New Segment/"):
+        markers = markers[1:]
+    return markers
+
+
+def event_code(description: str, others: dict):
+    """
+    Returns the MNE event code of a marker description.
+
+    :param others: Codes already given to non standard descriptions; updated in place.
+    """
+    digits = description[-3:].strip()
+    kind = description[:-3]
+    if digits.isdigit() and kind in EVENT_OFFSETS:
+        return int(digits) + EVENT_OFFSETS[kind]
+    if description in OTHER_MARKERS:
+        return OTHER_MARKERS[description]
+    if description not in others:
+        others[description] = OTHER_OFFSET + len(others)
+    return others[description]
+
+
+def read_events(vhdr_path: str):
+    """
+    Reads the sampling rate, channels and events of a recording without touching the .eeg data.
+
+    The events and event IDs are the same as those of
+    `mne.events_from_annotations(mne.io.read_raw_brainvision(vhdr_path))`, so they can be used
+    in place of the MNE path for event counting, QC, subject selection and epoching.
+
+    Parameters:
+        vhdr_path (str): Path to the .vhdr file.
+
+    Returns:
+        dict: With the keys `sfreq`, `ch_names`, `events` (MNE events array: sample, 0, id)
+              and `event_id` (description to ID mapping).
+    """
+    header = read_vhdr(vhdr_path)
+    markers = read_vmrk(header["marker_file"]) if header["marker_file"] else []
+
+    # Same order as mne.Annotations: by onset, then duration, then file order
+    markers = sorted((m[0], m[1], i, m[2]) for i, m in enumerate(markers))
+    markers = [m for m in markers if not IGNORED_MARKERS.match(m[3])]
+
+    # Codes of non standard descriptions depend on their sorted order, like in MNE
+    others, event_id = {}, {}
+    for description in sorted({m[3] for m in markers}):
+        event_id[description] = event_code(description, others)
+
+    events = np.array([[m[0], 0, event_id[m[3]]] for m in markers], dtype=int).reshape(-1, 3)
+    return {"sfreq": header["sfreq"], "ch_names": header["ch_names"],
+            "events": events, "event_id": event_id}
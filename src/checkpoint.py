@@ -0,0 +1,199 @@
+import os
+import json
+import hashlib
+import sqlite3
+import numpy as np
+import pandas as pd
+from Subjects import Participant
+from brainvision import read_vhdr
+from participant_table import COLUMNS
+
+
+def _plain(value):
+    # sqlite3 only binds built-in Python types
+    return value.item() if isinstance(value, np.generic) else value
+
+
+def _stat_key(paths):
+    parts = []
+    for path in paths:
+        try:
+            st = os.stat(path)
+            parts.append(f"{os.path.abspath(path)}:{st.st_size}:{st.st_mtime_ns}")
+        except OSError:
+            parts.append(f"{os.path.abspath(path)}:missing")
+    return parts
+
+
+class CohortCheckpoint:
+    def __init__(self, db_path: str):
+        """
+        SQLite checkpoint of per-subject cohort results.
+
+        Every finished subject is committed right away, so an interrupted run loses at most
+        the subjects that were in flight. A result is reused on the next run only if both its
+        input key (the recording files' sizes and mtimes) and its parameter key (task,
+        channels, events, window, filter and participants table) are unchanged.
+
+        :param db_path: Path to the SQLite database file. Created if missing.
+        """
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS results (
+                task TEXT NOT NULL,
+                params_key TEXT NOT NULL,
+                subject INTEGER NOT NULL,
+                input_key TEXT NOT NULL,
+                file_path TEXT,
+                gender TEXT,
+                age REAL,
+                highest_edu TEXT,
+                highest_adult_edu REAL,
+                income_household TEXT,
+                amp_diff REAL,
+                PRIMARY KEY (task, params_key, subject)
+            )""")
+        self.conn.commit()
+
+    @staticmethod
+    def params_key(task: str, channels, events_to_check, tmin: float, tmax: float,
+                   filter_settings: dict, participants_file: str):
+        """
+        Returns the key of the analysis parameters shared by all subjects of a run.
+        """
+        params = {
+            "task": task,
+            "channels": list(channels),
+            "events": [_plain(e) for e in events_to_check],
+            "window": [float(tmin), float(tmax)],
+            "filter": filter_settings,
+            "participants": _stat_key([participants_file]),
+        }
+        return hashlib.sha1(json.dumps(params, sort_keys=True).encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def input_key(vhdr_path: str):
+        """
+        Returns the key of a subject's recording files (.vhdr, .vmrk and .eeg).
+        """
+        paths = [vhdr_path]
+        try:
+            header = read_vhdr(vhdr_path)
+            paths += [header["data_file"], header["marker_file"]]
+        except Exception:
+            pass  # Unreadable header: the .vhdr stat alone still detects edits
+        return hashlib.sha1("|".join(_stat_key(paths)).encode("utf-8")).hexdigest()
+
+    def get(self, task: str, params_key: str, subject: int, input_key: str):
+        """
+        Returns the stored `Participant` of a subject, or None if it has to be computed again.
+        """
+        row = self.conn.execute(
+            "SELECT gender, age, highest_edu, highest_adult_edu, income_household, amp_diff "
+            "FROM results WHERE task = ? AND params_key = ? AND subject = ? AND input_key = ?",
+            (task, params_key, subject, input_key)).fetchone()
+        if row is None:
+            return None
+        return Participant(*row)
+
+    def put(self, task: str, params_key: str, subject: int, input_key: str, file_path: str, participant):
+        """
+        Stores (or replaces) the result of a subject and commits it.
+        """
+        values = [_plain(getattr(participant, attr)) for attr in COLUMNS.values()]
+        self.conn.execute(
+            "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [task, params_key, subject, input_key, file_path] + values)
+        self.conn.commit()
+
+    def to_dataframe(self, task: str, params_key: str):
+        """
+        Returns the stored results of a run as a DataFrame ordered by subject, with the
+        same columns the analysis scripts export.
+        """
+        df = pd.read_sql_query(
+            f"SELECT subject, {', '.join(COLUMNS.values())} FROM results "
+            "WHERE task = ? AND params_key = ? ORDER BY subject",
+            self.conn, params=(task, params_key))
+        return df.rename(columns={attr: col for col, attr in COLUMNS.items()})
+
+    def to_excel(self, excel_path: str, task: str, params_key: str):
+        """
+        Optional final export of a run to Excel.
+        """
+        self.to_dataframe(task, params_key).drop(columns="subject").to_excel(excel_path, index=False)
+
+    def close(self):
+        self.conn.close()
+
+
+# Columns of a grid cell result, as returned by `EpochedRecord.query`
+GRID_COLUMNS = ["n_rare", "n_freq", "mean_rare", "mean_freq", "amp_diff"]
+
+
+class GridCheckpoint:
+    def __init__(self, db_path: str):
+        """
+        SQLite memo of parameter-grid results, one row per (subject, grid cell).
+
+        A cell is reused while the subject's recording files are unchanged (input key) and
+        its parameters (channels, rare events, window, filter) give the same query key, so
+        extending a grid only computes the new cells.
+
+        :param db_path: Path to the SQLite database file. Created if missing. It can be the
+                        same file as a `CohortCheckpoint`.
+        """
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS grid_results (
+                task TEXT NOT NULL,
+                subject INTEGER NOT NULL,
+                query_key TEXT NOT NULL,
+                input_key TEXT NOT NULL,
+                n_rare INTEGER,
+                n_freq INTEGER,
+                mean_rare REAL,
+                mean_freq REAL,
+                amp_diff REAL,
+                PRIMARY KEY (task, subject, query_key)
+            )""")
+        self.conn.commit()
+
+    @staticmethod
+    def query_key(channels, rare_events, tmin: float, tmax: float, filter_settings: dict):
+        """
+        Returns the key of one grid cell.
+        """
+        params = {
+            "channels": list(channels),
+            "events": [_plain(e) for e in rare_events],
+            "window": [float(tmin), float(tmax)],
+            "filter": filter_settings,
+        }
+        return hashlib.sha1(json.dumps(params, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def get_many(self, task: str, subject: int, input_key: str, query_keys):
+        """
+        Returns {query key: (n_rare, n_freq, mean_rare, mean_freq, amp_diff)} of the stored cells.
+        """
+        rows = self.conn.execute(
+            f"SELECT query_key, {', '.join(GRID_COLUMNS)} FROM grid_results "
+            "WHERE task = ? AND subject = ? AND input_key = ?", (task, subject, input_key)).fetchall()
+        wanted = set(query_keys)
+        return {row[0]: row[1:] for row in rows if row[0] in wanted}
+
+    def put_many(self, task: str, subject: int, input_key: str, cells):
+        """
+        Stores (or replaces) cells of a subject and commits them.
+
+        :param cells: Iterable of (query key, (n_rare, n_freq, mean_rare, mean_freq, amp_diff)).
+        """
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO grid_results VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [[task, subject, key, input_key] + [_plain(v) for v in values] for key, values in cells])
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
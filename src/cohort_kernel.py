@@ -0,0 +1,230 @@
+import warnings
+import numpy as np
+import pandas as pd
+from Subjects import EegRecordSubject
+from dataset_index import get_index
+
+
+class CohortEpochs:
+    def __init__(self, subjects, data_list, event_ids_list, times, sfreq: float, channels, dtype=np.float64,
+                 channels_list=None):
+        """
+        Epoched ROI data of many subjects stacked into one padded array.
+
+        Subjects have different numbers of epochs, so the epochs axis is padded to the
+        largest subject and a mask marks the real epochs.
+
+        :param subjects: Subject numbers, one per entry of `data_list`.
+        :param data_list: Per-subject epochs, each of shape (epochs, channels, samples).
+        :param event_ids_list: Per-subject event ID of every epoch.
+        :param times: Time (in seconds) of every sample relative to the event, shared by all subjects.
+        :param sfreq: Sampling rate in Hz, shared by all subjects.
+        :param channels: Channel names, in the order of the channel axis, shared by all subjects.
+        :param dtype: Dtype of the stacked array; float32 halves the memory of large cohorts.
+        :param channels_list: Per-subject channel names, in the order of their channel axis. If
+                              given, each must be identical to `channels`, order included.
+        """
+        self.subjects = np.asarray(subjects)
+        self.times = np.asarray(times)
+        self.sfreq = sfreq
+        self.channels = list(channels)
+
+        n_epochs = max((len(d) for d in data_list), default=0)
+        shape = (len(data_list), n_epochs, len(self.channels), len(self.times))
+        self.data = np.zeros(shape, dtype=dtype)
+        self.valid = np.zeros(shape[:2], dtype=bool)
+        self.event_ids = np.full(shape[:2], -1, dtype=int)
+
+        for s, (data, event_ids) in enumerate(zip(data_list, event_ids_list)):
+            if channels_list is not None and list(channels_list[s]) != self.channels:
+                raise ValueError(f"Subject {subjects[s]} has channels {list(channels_list[s])}, "
+                                 f"expected {self.channels} in this order")
+            if data.shape[1:] != shape[2:]:
+                raise ValueError(f"Subject {subjects[s]} has epochs of shape {data.shape[1:]}, "
+                                 f"expected {shape[2:]}")
+            self.data[s, :len(data)] = data
+            self.valid[s, :len(data)] = True
+            self.event_ids[s, :len(data)] = event_ids
+
+    @classmethod
+    def from_records(cls, records, dtype=np.float64):
+        """
+        Stacks the `EpochedRecord` objects of many subjects.
+
+        :param records: Dict subject number -> `EpochedRecord` (see `EegRecordSubject.epoch_once`).
+                        All records must share the channels (in the same order), times and
+                        sampling rate.
+        """
+        subjects = sorted(records)
+        if not subjects:
+            raise ValueError("No records to stack")
+        first = records[subjects[0]]
+        return cls(subjects, [records[s].data for s in subjects], [records[s].event_ids for s in subjects],
+                   first.times, first.sfreq, first.channels, dtype=dtype,
+                   channels_list=[records[s].channels for s in subjects])
+
+    def _windows(self, windows):
+        # Same sample index convention as find_amp_diff_2 (inclusive tmax sample)
+        n_times = len(self.times)
+        bounds = []
+        for tmin, tmax in windows:
+            start = int((tmin - self.times[0]) * self.sfreq)
+            stop = int((tmax - self.times[0]) * self.sfreq) + 1
+            bounds.append((min(max(start, 0), n_times), min(max(stop, 0), n_times)))
+        return np.array(bounds).reshape(-1, 2)
+
+    def compute(self, rare_events, windows, channels=None):
+        """
+        Computes rare/frequent mean amplitudes of every subject for many time windows at once.
+
+        The epochs of every subject are first averaged into one rare and one frequent waveform
+        with a single masked reduction over the whole padded array; the window means are then
+        read from cumulative sums of those waveforms. Since the mean over epochs and the mean
+        over samples commute, the result equals `find_amp_diff_2` subject by subject.
+
+        Parameters:
+            rare_events (list[int]): List of event IDs that are considered "rare" events.
+            windows (list[tuple]): (tmin, tmax) time windows in seconds.
+            channels (list[str], optional): Subset of the stacked channels to use. Defaults to all.
+
+        Returns:
+            CohortERP: The per-subject, per-channel and grand average results.
+        """
+        picks = slice(None) if channels is None else [self.channels.index(ch) for ch in channels]
+        channels = self.channels if channels is None else list(channels)
+        data = self.data[:, :, picks]
+
+        rare = self.valid & np.isin(self.event_ids, rare_events)
+        freq = self.valid & ~rare
+        n_rare = rare.sum(axis=1)
+        n_freq = freq.sum(axis=1)
+
+        with np.errstate(invalid="ignore", divide="ignore"):
+            wave_rare = np.einsum("sect,se->sct", data, rare.astype(data.dtype)) / n_rare[:, None, None]
+            wave_freq = np.einsum("sect,se->sct", data, freq.astype(data.dtype)) / n_freq[:, None, None]
+
+        bounds = self._windows(windows)
+        starts, stops = bounds[:, 0], bounds[:, 1]
+
+        def window_means(wave):
+            csum = np.zeros(wave.shape[:2] + (wave.shape[2] + 1,))
+            np.cumsum(wave, axis=2, out=csum[:, :, 1:])
+            with np.errstate(invalid="ignore", divide="ignore"):
+                return (csum[:, :, stops] - csum[:, :, starts]) / (stops - starts)
+
+        return CohortERP(
+            subjects=self.subjects, channels=channels, windows=[tuple(w) for w in windows],
+            times=self.times, n_rare=n_rare, n_freq=n_freq,
+            wave_rare=wave_rare, wave_freq=wave_freq,
+            channel_rare=window_means(wave_rare), channel_freq=window_means(wave_freq),
+        )
+
+
+class CohortERP:
+    def __init__(self, subjects, channels, windows, times, n_rare, n_freq,
+                 wave_rare, wave_freq, channel_rare, channel_freq):
+        """
+        Results of `CohortEpochs.compute`, stored as labelled NumPy arrays.
+
+        Dimensions: s = subject, c = channel, t = sample, w = window.
+
+        - `wave_rare`, `wave_freq` (s, c, t): average rare/frequent waveform of every subject.
+        - `channel_rare`, `channel_freq`, `channel_diff` (s, c, w): per-channel window means.
+        - `mean_rare`, `mean_freq`, `amp_diff` (s, w): means over the channels; `amp_diff`
+          is the `find_amp_diff_2` value of every subject and window.
+        - `grand_wave_rare`, `grand_wave_freq` (c, t) and `grand_amp_diff` (w): averages over
+          the subjects, ignoring subjects without rare or frequent epochs.
+        """
+        self.subjects = np.asarray(subjects)
+        self.channels = list(channels)
+        self.windows = list(windows)
+        self.times = np.asarray(times)
+        self.n_rare = n_rare
+        self.n_freq = n_freq
+        self.wave_rare = wave_rare
+        self.wave_freq = wave_freq
+        self.channel_rare = channel_rare
+        self.channel_freq = channel_freq
+        self.channel_diff = channel_rare - channel_freq
+        self.mean_rare = channel_rare.mean(axis=1)
+        self.mean_freq = channel_freq.mean(axis=1)
+        self.amp_diff = self.mean_rare - self.mean_freq
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)  # All-NaN columns give NaN
+            self.grand_wave_rare = np.nanmean(wave_rare, axis=0)
+            self.grand_wave_freq = np.nanmean(wave_freq, axis=0)
+            self.grand_amp_diff = np.nanmean(self.amp_diff, axis=0)
+
+    def to_dataframe(self):
+        """
+        Tidy table with one row per (subject, window).
+        """
+        n_subjects, n_windows = self.amp_diff.shape
+        return pd.DataFrame({
+            "subject": np.repeat(self.subjects, n_windows),
+            "tmin": np.tile([w[0] for w in self.windows], n_subjects),
+            "tmax": np.tile([w[1] for w in self.windows], n_subjects),
+            "n_rare": np.repeat(self.n_rare, n_windows),
+            "n_freq": np.repeat(self.n_freq, n_windows),
+            "mean_rare": self.mean_rare.ravel(),
+            "mean_freq": self.mean_freq.ravel(),
+            "amp_diff": self.amp_diff.ravel(),
+        })
+
+    def channel_dataframe(self):
+        """
+        Tidy table with one row per (subject, channel, window).
+        """
+        n_subjects, n_channels, n_windows = self.channel_diff.shape
+        return pd.DataFrame({
+            "subject": np.repeat(self.subjects, n_channels * n_windows),
+            "channel": np.tile(np.repeat(self.channels, n_windows), n_subjects),
+            "tmin": np.tile([w[0] for w in self.windows], n_subjects * n_channels),
+            "tmax": np.tile([w[1] for w in self.windows], n_subjects * n_channels),
+            "mean_rare": self.channel_rare.ravel(),
+            "mean_freq": self.channel_freq.ravel(),
+            "amp_diff": self.channel_diff.ravel(),
+        })
+
+    def to_xarray(self):
+        """
+        Returns the results as an `xarray.Dataset` (requires the optional xarray package).
+        """
+        import xarray as xr
+
+        coords = {"subject": self.subjects, "channel": self.channels, "time": self.times,
+                  "window": [f"{a}-{b}" for a, b in self.windows]}
+        return xr.Dataset({
+            "wave_rare": (("subject", "channel", "time"), self.wave_rare),
+            "wave_freq": (("subject", "channel", "time"), self.wave_freq),
+            "channel_diff": (("subject", "channel", "window"), self.channel_diff),
+            "amp_diff": (("subject", "window"), self.amp_diff),
+            "n_rare": (("subject",), self.n_rare),
+            "n_freq": (("subject",), self.n_freq),
+        }, coords=coords)
+
+
+def load_cohort_epochs(path: str, channels, task="visualoddball", max_files=0, lazy=True, dtype=np.float64):
+    """
+    Epochs every recording of a task once over `channels` and stacks them into `CohortEpochs`.
+
+    Parameters:
+        path (str): The root directory containing the EEG data.
+        channels (list[str]): Union of the channels that will be analyzed.
+        task (str, optional): Task name as it appears in the file names. Default is "visualoddball".
+        max_files (int, optional): The highest subject number to load. If 0, loads all subjects.
+        lazy (bool, optional): Load the records in lazy mode, so only the ROI channels are read.
+        dtype (optional): Dtype of the stacked array.
+
+    Notes:
+        - Subjects that fail to load are printed and skipped.
+    """
+    index = get_index(path)
+    records = {}
+    for i in index.subjects(task, max_files):
+        file_path = index.vhdr_path(i, task)
+        try:
+            records[i] = EegRecordSubject(file_path, lazy=lazy).epoch_once(channels)
+        except Exception as e:
+            print(f"Failed to load {file_path}: {e}")
+    return CohortEpochs.from_records(records, dtype=dtype)
@@ -0,0 +1,441 @@
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, as_completed, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+from Subjects import EegRecordSubject
+from amp_funcs import participant_from_row
+from dataset_index import PARTICIPANTS_FILE, get_index
+from checkpoint import CohortCheckpoint
+from shared_raw import SharedRawStore, publish, attach, expected_shape
+import profiling
+
+
+class SubjectResult:
+    def __init__(self, subject: int, file_path: str, participant=None, error=None, cached=False):
+        """
+        Outcome of processing a single subject in a cohort run.
+
+        :param subject: Subject number (the `XXX` in `sub-XXX`).
+        :param file_path: Path to the subject's .vhdr file.
+        :param participant: The `Participant` built for the subject, or None if processing failed.
+        :param error: Description of the failure, or None if processing succeeded.
+        :param cached: True if the result was taken from a checkpoint instead of being computed.
+        """
+        self.subject = subject
+        self.file_path = file_path
+        self.participant = participant
+        self.error = error
+        self.cached = cached
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    def __repr__(self):
+        status = ("cached" if self.cached else "ok") if self.ok else f"error={self.error}"
+        return f"SubjectResult(subject={self.subject}, {status})"
+
+
+def _amp_diff_job(file_path: str, channels, events_to_check, tmin: float, tmax: float,
+                  cache=None, lazy=False, filter_method="mne"):
+    """
+    Worker entry point: loads one EEG record and returns its amplitude difference.
+    Must stay a module level function so it can be pickled to the worker processes.
+    """
+    eeg_r = EegRecordSubject(file_path, cache=cache, lazy=lazy, filter_method=filter_method, channels=channels)
+    return eeg_r.find_amp_diff_2(channels, events_to_check, tmin, tmax)
+
+
+def _profiled_amp_diff_job(subject: int, trace_memory: bool, *args):
+    """
+    `_amp_diff_job` run under a profiler of the worker process. Returns (amp_diff, records);
+    on failure the records are attached to the exception as `profile_records`.
+    """
+    profiler = profiling.enable(trace_memory)
+    try:
+        with profiler.subject(subject):
+            amp_diff = _amp_diff_job(*args)
+        return amp_diff, profiler.records
+    except Exception as e:
+        e.profile_records = profiler.records
+        raise
+    finally:
+        profiling.disable()
+
+
+def _submit(pool, subject, file_path, args, profiler):
+    if profiler is None:
+        return pool.submit(_amp_diff_job, file_path, *args)
+    return pool.submit(_profiled_amp_diff_job, subject, profiler.trace_memory, file_path, *args)
+
+
+def _result(future, profiler):
+    # Merges the worker's profile records into the parent profiler, if profiling
+    try:
+        result = future.result()
+    except Exception as e:
+        if profiler is not None:
+            profiler.add(getattr(e, "profile_records", []))
+        raise
+    if profiler is None:
+        return result
+    amp_diff, records = result
+    profiler.add(records)
+    return amp_diff
+
+
+def _finish(subject, file_path, index, amp_diff):
+    # Metadata is attached in the parent process so the table is never sent to the workers
+    try:
+        return SubjectResult(subject, file_path, participant_from_row(index.participant(subject), amp_diff))
+    except Exception as e:
+        return SubjectResult(subject, file_path, error=f"{type(e).__name__}: {e}")
+
+
+def iter_amp_diff_data(path: str, channels, events_to_check, tmin: float, tmax: float,
+                       task="visualoddball", max_files=0, n_workers=None,
+                       participants_file=PARTICIPANTS_FILE, cache=None,
+                       lazy=False, subjects=None, filter_method="mne"):
+    """
+    Runs the amplitude difference extraction of a whole cohort in a process pool and
+    yields a `SubjectResult` for every subject as soon as it finishes.
+
+    Each subject's `EegRecordSubject` load + `find_amp_diff_2` call runs in a worker process,
+    so a failure in one subject is reported in its own result and the run continues. If a
+    worker process dies (e.g. a crash inside a native library), the subjects that were in
+    flight are retried one by one in isolated processes, and only the one that crashes
+    again is reported as failed.
+
+    Parameters:
+        path (str): The root directory containing the EEG data.
+        channels (list[str]): List of EEG channel names to analyze.
+        events_to_check (list[int]): List of event IDs that are considered "rare" events.
+        tmin (float): Start time (in seconds) of the amplitude window relative to the event.
+        tmax (float): End time (in seconds) of the amplitude window relative to the event.
+        task (str, optional): Task name as it appears in the file names. Default is "visualoddball".
+        max_files (int, optional): The highest subject number to process.
+                                   If 0, processes all available participants.
+        n_workers (int, optional): Number of worker processes. Defaults to `os.cpu_count()`.
+        participants_file (str, optional): Path to the participants demographic table.
+        cache (FilteredRawCache, optional): Cache of filtered recordings shared by the workers.
+        lazy (bool, optional): Load the records in lazy, memory-mapped mode, which keeps the
+                               memory of every worker low when many run at once.
+        subjects (list[int], optional): Subject numbers to process instead of 1..max_files.
+        filter_method (str, optional): Filtering engine, see `filtering.METHODS`. Default is "mne".
+
+    Yields:
+        SubjectResult: One result per existing EEG record, in completion order.
+
+    Notes:
+        - Recordings are found with the cached `DatasetIndex` of `path`, and metadata is matched
+          by participant ID, like in the serial path.
+        - On platforms that spawn worker processes (Windows), call this from under
+          `if __name__ == "__main__":` in scripts.
+        - If a `profiling` profiler is enabled in the calling process, every worker profiles
+          its subject and the records are merged into it.
+    """
+    index = get_index(path, participants_file)
+
+    if subjects is None:
+        subjects = index.subjects(task, max_files)
+
+    jobs = {}
+    for i in subjects:
+        file_path = index.vhdr_path(i, task)
+        if file_path is not None:
+            jobs[i] = file_path
+
+    args = (channels, events_to_check, tmin, tmax, cache, lazy, filter_method)
+    profiler = profiling.active()
+    suspects = []
+
+    with ProcessPoolExecutor(max_workers=n_workers) as pool:
+        futures = {_submit(pool, i, file_path, args, profiler): i for i, file_path in jobs.items()}
+        for future in as_completed(futures):
+            i = futures[future]
+            try:
+                amp_diff = _result(future, profiler)
+            except BrokenProcessPool:
+                suspects.append(i)
+                continue
+            except Exception as e:
+                yield SubjectResult(i, jobs[i], error=f"{type(e).__name__}: {e}")
+                continue
+            yield _finish(i, jobs[i], index, amp_diff)
+
+    # A dead worker breaks the whole pool, so every subject still pending at that moment
+    # lands here. Re-run each of them alone to find the one that actually crashes.
+    for i in sorted(suspects):
+        with ProcessPoolExecutor(max_workers=1) as pool:
+            try:
+                amp_diff = _result(_submit(pool, i, jobs[i], args, profiler), profiler)
+            except BrokenProcessPool:
+                yield SubjectResult(i, jobs[i], error="worker process crashed")
+                continue
+            except Exception as e:
+                yield SubjectResult(i, jobs[i], error=f"{type(e).__name__}: {e}")
+                continue
+        yield _finish(i, jobs[i], index, amp_diff)
+
+
+def get_amp_diff_data_parallel(path: str, channels, events_to_check, tmin: float, tmax: float,
+                               task="visualoddball", max_files=0, n_workers=None,
+                               participants_file=PARTICIPANTS_FILE, cache=None,
+                               lazy=False, filter_method="mne"):
+    """
+    Parallel counterpart of `get_amp_diff_data` / `get_amp_diff_data_VS`.
+
+    Collects the results of `iter_amp_diff_data` and returns the participants ordered by
+    subject number, so the output is identical to the serial functions. Failed subjects
+    are printed and skipped.
+
+    Returns:
+        list[Participant]: A list of `Participant` objects, one per successfully processed subject.
+    """
+    results = {}
+    for result in iter_amp_diff_data(path, channels, events_to_check, tmin, tmax, task=task,
+                                     max_files=max_files, n_workers=n_workers,
+                                     participants_file=participants_file, cache=cache,
+                                     lazy=lazy, filter_method=filter_method):
+        if result.ok:
+            results[result.subject] = result.participant
+        else:
+            print(f"Failed to load {result.file_path}: {result.error}")
+
+    return [results[i] for i in sorted(results)]
+
+
+def _publish_job(file_path: str, segment):
+    """
+    Worker entry point: loads and filters one EEG record and writes it into a shared segment
+    created by the parent process.
+    """
+    eeg_r = EegRecordSubject(file_path)
+    if eeg_r.raw is None:
+        raise RuntimeError(f"Could not load {file_path}")
+    return publish(eeg_r, segment)
+
+
+def _shared_amp_diff_job(handle, channels, events_to_check, tmin: float, tmax: float):
+    """
+    Worker entry point: runs `find_amp_diff_2` on a record attached from shared memory.
+    """
+    shared = attach(handle)
+    try:
+        return shared.record.find_amp_diff_2(channels, events_to_check, tmin, tmax)
+    finally:
+        shared.close()
+
+
+def _schedule_param_sets(pool, store, queue, jobs, index, param_sets, max_published, suspects):
+    """
+    Publishes and queries the subjects of `queue` ((subject, parameter set indices) pairs) on
+    `pool`, yielding (parameter set index, `SubjectResult`).
+
+    If a worker process dies, the pool is broken: nothing more is submitted, the subjects not
+    started stay in `queue`, and the (subject, parameter set indices) that were in flight are
+    appended to `suspects`.
+    """
+    running = {}  # future -> (subject, parameter set indices, index or None for a publish job, segment name)
+    failed = []
+    crashed = {}  # subject -> parameter set indices lost with the pool
+    broken = False
+
+    def fail(i, ks, e):
+        for k in ks:
+            yield k, SubjectResult(i, jobs[i], error=f"{type(e).__name__}: {e}")
+
+    def publish_next():
+        nonlocal broken
+        while queue and not broken:
+            i, ks = queue.popleft()
+            try:
+                segment = store.create(expected_shape(jobs[i]))
+            except Exception as e:
+                failed.append((i, ks, e))
+                continue
+            try:
+                running[pool.submit(_publish_job, jobs[i], segment)] = (i, ks, None, segment.name)
+            except BrokenProcessPool:
+                store.discard(segment.name)
+                queue.appendleft((i, ks))  # Not started: left to the next pool
+                broken = True
+            return
+
+    for _ in range(max_published):
+        publish_next()
+
+    while running or failed:
+        while failed:
+            yield from fail(*failed.pop(0))
+        if not running:
+            break
+        done, _ = wait(running, return_when=FIRST_COMPLETED)
+        for future in done:
+            i, ks, k, name = running.pop(future)
+            if k is None:
+                try:
+                    handle = future.result()
+                except BrokenProcessPool:
+                    store.discard(name)
+                    crashed.setdefault(i, []).extend(ks)
+                    broken = True
+                    continue
+                except Exception as e:
+                    store.discard(name)
+                    yield from fail(i, ks, e)
+                    publish_next()
+                    continue
+                store.adopt(handle, refs=len(ks))
+                for k in ks:
+                    try:
+                        running[pool.submit(_shared_amp_diff_job, handle, *param_sets[k])] = (i, ks, k, handle.name)
+                    except BrokenProcessPool:
+                        store.release(handle.name)
+                        crashed.setdefault(i, []).append(k)
+                        broken = True
+                continue
+
+            try:
+                result = _finish(i, jobs[i], index, future.result())
+            except BrokenProcessPool:
+                crashed.setdefault(i, []).append(k)
+                broken = True
+                store.release(name)
+                continue
+            except Exception as e:
+                result = SubjectResult(i, jobs[i], error=f"{type(e).__name__}: {e}")
+            if store.release(name):
+                publish_next()
+            yield k, result
+
+    suspects.extend((i, sorted(ks)) for i, ks in crashed.items())
+
+
+def iter_param_sets(path: str, param_sets, task="visualoddball", max_files=0, n_workers=None,
+                    participants_file=PARTICIPANTS_FILE, max_published=None):
+    """
+    Runs several amplitude difference analyses of the same cohort, filtering every recording once.
+
+    Each recording is loaded and filtered by one worker and published to shared memory. The
+    queries of all parameter sets then run in the pool on zero-copy views of that segment,
+    and the segment is freed as soon as its last query finishes (see `SharedRawStore`).
+
+    Parameters:
+        path (str): The root directory containing the EEG data.
+        param_sets (list[tuple]): (channels, events_to_check, tmin, tmax) of every analysis.
+        task (str, optional): Task name as it appears in the file names. Default is "visualoddball".
+        max_files (int, optional): The highest subject number to process.
+                                   If 0, processes all available participants.
+        n_workers (int, optional): Number of worker processes. Defaults to `os.cpu_count()`.
+        participants_file (str, optional): Path to the participants demographic table.
+        max_published (int, optional): Most recordings held in shared memory at once, which
+                                       bounds the memory use. Defaults to the number of workers.
+
+    Yields:
+        tuple: (index of the parameter set, `SubjectResult`), in completion order.
+
+    Notes:
+        - A subject that fails to load gets a failed result for every parameter set.
+        - A filtered recording takes channels x samples x 8 bytes. The segments are created
+          and owned by the calling process. On POSIX systems they are shared memory (RAM,
+          /dev/shm on Linux); on Windows they are temporary memory-mapped files (see
+          `shared_raw.USE_SHARED_MEMORY`).
+    """
+    index = get_index(path, participants_file)
+    jobs = {i: index.vhdr_path(i, task) for i in index.subjects(task, max_files)}
+    queue = deque((i, list(range(len(param_sets)))) for i in sorted(jobs))
+    max_published = max_published or n_workers or os.cpu_count()
+
+    with SharedRawStore() as store:
+        while queue:
+            suspects = []
+            with ProcessPoolExecutor(max_workers=n_workers) as pool:
+                yield from _schedule_param_sets(pool, store, queue, jobs, index, param_sets, max_published, suspects)
+
+            # A dead worker breaks the whole pool, so every subject in flight at that moment
+            # lands here. Re-run each of them alone to find the one that actually crashes.
+            for i, ks in sorted(suspects):
+                crashed = []
+                with ProcessPoolExecutor(max_workers=1) as pool:
+                    yield from _schedule_param_sets(pool, store, deque([(i, ks)]), jobs, index, param_sets, 1, crashed)
+                for i, ks in crashed:
+                    for k in ks:
+                        yield k, SubjectResult(i, jobs[i], error="worker process crashed")
+
+
+def get_amp_diff_data_param_sets(path: str, param_sets, task="visualoddball", max_files=0, n_workers=None,
+                                 participants_file=PARTICIPANTS_FILE, max_published=None):
+    """
+    Collects `iter_param_sets`: one list of `Participant` objects per parameter set, ordered
+    by subject number like `get_amp_diff_data`. Failed subjects are printed and skipped.
+    """
+    results = [{} for _ in param_sets]
+    for k, result in iter_param_sets(path, param_sets, task=task, max_files=max_files, n_workers=n_workers,
+                                     participants_file=participants_file, max_published=max_published):
+        if result.ok:
+            results[k][result.subject] = result.participant
+        else:
+            print(f"Failed to load {result.file_path}: {result.error}")
+
+    return [[r[i] for i in sorted(r)] for r in results]
+
+
+def iter_cohort(path: str, channels, events_to_check, tmin: float, tmax: float, checkpoint,
+                task="visualoddball", max_files=0, n_workers=None,
+                participants_file=PARTICIPANTS_FILE, cache=None, lazy=False, filter_method="mne"):
+    """
+    Resumable version of `iter_amp_diff_data` backed by a `CohortCheckpoint`.
+
+    Subjects already stored in the checkpoint with unchanged recording files and parameters
+    are yielded right away (with `cached=True`) without loading anything. The others run in
+    the process pool, and every successful result is committed to the checkpoint as soon
+    as it arrives, so a crashed or interrupted run resumes where it stopped.
+
+    Parameters:
+        checkpoint (CohortCheckpoint): Store the results are read from and appended to.
+        Other parameters are the same as in `iter_amp_diff_data`.
+
+    Yields:
+        SubjectResult: Cached results first, then computed ones in completion order.
+
+    Notes:
+        - Failed subjects are not stored, so they are retried on the next run.
+        - Use `checkpoint.to_dataframe` / `checkpoint.to_excel` with `run_params_key` to export
+          the results once the run is over.
+    """
+    index = get_index(path, participants_file)
+    params_key = run_params_key(channels, events_to_check, tmin, tmax, task, participants_file, filter_method)
+
+    todo, input_keys = [], {}
+    for i in index.subjects(task, max_files):
+        file_path = index.vhdr_path(i, task)
+        input_keys[i] = CohortCheckpoint.input_key(file_path)
+        participant = checkpoint.get(task, params_key, i, input_keys[i])
+        if participant is not None:
+            yield SubjectResult(i, file_path, participant, cached=True)
+        else:
+            todo.append(i)
+
+    if not todo:
+        return
+
+    for result in iter_amp_diff_data(path, channels, events_to_check, tmin, tmax, task=task,
+                                     n_workers=n_workers, participants_file=participants_file,
+                                     cache=cache, lazy=lazy, subjects=todo, filter_method=filter_method):
+        if result.ok:
+            checkpoint.put(task, params_key, result.subject, input_keys[result.subject],
+                           result.file_path, result.participant)
+        yield result
+
+
+def run_params_key(channels, events_to_check, tmin: float, tmax: float, task="visualoddball",
+                   participants_file=PARTICIPANTS_FILE, filter_method="mne"):
+    """
+    Returns the checkpoint parameter key of a cohort run, for exporting its results.
+    """
+    filter_settings = dict(EegRecordSubject.FILTER)
+    if filter_method != "mne":
+        filter_settings["method"] = filter_method  # Keys of the default engine stay unchanged
+    return CohortCheckpoint.params_key(task, channels, events_to_check, tmin, tmax,
+                                       filter_settings, participants_file)
@@ -0,0 +1,119 @@
+import os
+import re
+import pandas as pd
+
+# The participants table ships next to the modules
+PARTICIPANTS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "participants.xlsx")
+
+_VHDR_NAME = re.compile(r"^(sub-[^_]+)_(?:ses-[^_]+_)?task-([^_]+)(?:_.*)?_eeg\.vhdr$")
+
+# Process wide caches, validated by modification times
+_indexes = {}
+_participants = {}
+
+
+def _subject_number(subject_id: str):
+    digits = subject_id[len("sub-"):]
+    return int(digits) if digits.isdigit() else None
+
+
+def _scan_signature(root: str):
+    """
+    Modification times of the dataset root and of every `sub-*/eeg` folder.
+    Adding, removing or renaming a recording changes the mtime of its folder.
+    """
+    signature = [os.stat(root).st_mtime_ns]
+    with os.scandir(root) as entries:
+        for entry in sorted(entries, key=lambda e: e.name):
+            if entry.name.startswith("sub-") and entry.is_dir():
+                try:
+                    signature.append((entry.name, os.stat(os.path.join(entry.path, "eeg")).st_mtime_ns))
+                except FileNotFoundError:
+                    signature.append((entry.name, None))
+    return tuple(signature)
+
+
+def read_participants(participants_file=PARTICIPANTS_FILE):
+    """
+    Reads the participants table once per modification of the file.
+
+    :return: Dict mapping participant ID (e.g. "sub-001") to its row (`pandas.Series`).
+    """
+    path = os.path.abspath(participants_file)
+    mtime = os.stat(path).st_mtime_ns
+    cached = _participants.get(path)
+    if cached is None or cached[0] != mtime:
+        df = pd.read_excel(path)
+        cached = (mtime, {row["participant_id"]: row for _, row in df.iterrows()})
+        _participants[path] = cached
+    return cached[1]
+
+
+class DatasetIndex:
+    def __init__(self, root: str, participants_file=PARTICIPANTS_FILE):
+        """
+        Index of a BIDS-style EEG dataset (`sub-XXX/eeg/sub-XXX_task-<task>_eeg.vhdr`).
+
+        The tree is scanned once, for every task at the same time, and participant metadata
+        is looked up by participant ID instead of by row position. Use `get_index` to share
+        the index between calls, it is rebuilt only when the tree or table changes.
+
+        :param root: The root directory containing the EEG data.
+        :param participants_file: Path to the participants demographic table.
+        """
+        self.root = os.path.abspath(root)
+        self.participants_file = participants_file
+        self.signature = _scan_signature(self.root)
+        self.files = {}  # subject ID -> task -> .vhdr path
+        self.ids = {}  # subject number -> subject ID
+
+        for name, _ in self.signature[1:]:
+            eeg_folder = os.path.join(self.root, name, "eeg")
+            if not os.path.isdir(eeg_folder):
+                continue
+            for filename in os.listdir(eeg_folder):
+                match = _VHDR_NAME.match(filename)
+                if match and match.group(1) == name:
+                    if _subject_number(name) is not None:
+                        self.ids[_subject_number(name)] = name
+                    self.files.setdefault(name, {})[match.group(2)] = os.path.join(eeg_folder, filename)
+
+    def tasks(self):
+        return sorted({task for tasks in self.files.values() for task in tasks})
+
+    def subjects(self, task: str, max_files=0):
+        """
+        Returns the sorted subject numbers that have a recording of `task`.
+
+        :param max_files: If not 0, only subjects numbered up to `max_files` are returned.
+        """
+        numbers = sorted(n for n, sub in self.ids.items() if task in self.files[sub])
+        if max_files:
+            numbers = [n for n in numbers if n <= max_files]
+        return numbers
+
+    def vhdr_path(self, subject: int, task: str):
+        """
+        Returns the .vhdr path of a subject's recording of `task`, or None if it does not exist.
+        """
+        return self.files.get(self.ids.get(subject), {}).get(task)
+
+    def participant(self, subject: int):
+        """
+        Returns the participants table row of a subject.
+
+        :raises KeyError: If the subject is missing from the table.
+        """
+        return read_participants(self.participants_file)[self.ids.get(subject, f"sub-{subject:03}")]
+
+
+def get_index(root: str, participants_file=PARTICIPANTS_FILE):
+    """
+    Returns the cached `DatasetIndex` of `root`, rescanning only if the tree changed.
+    """
+    key = (os.path.abspath(root), os.path.abspath(participants_file))
+    index = _indexes.get(key)
+    if index is None or index.signature != _scan_signature(key[0]):
+        index = DatasetIndex(root, participants_file)
+        _indexes[key] = index
+    return index
@@ -0,0 +1,146 @@
+import numpy as np
+import mne
+import pandas as pd
+
+
+class EpochedRecord:
+    def __init__(self, data, event_ids, times, sfreq: float, channels):
+        """
+        Answers many amplitude difference queries on the same set of epochs.
+
+        The epochs are kept as one contiguous (epochs x channels x samples) array, and a
+        cumulative sum over the time axis is precomputed, so the mean of any time window
+        is a single subtraction. Use `from_raw` to build it from a filtered recording.
+
+        :param data: Baseline corrected epochs, shape (epochs, channels, samples).
+        :param event_ids: Event ID of every epoch.
+        :param times: Time (in seconds) of every sample relative to the event.
+        :param sfreq: Sampling rate in Hz.
+        :param channels: Channel names, in the order of the channel axis of `data`.
+        """
+        self.channels = list(channels)
+        self.data = np.ascontiguousarray(data)
+        self.event_ids = np.asarray(event_ids).copy()
+        self.times = np.asarray(times)
+        self.sfreq = sfreq
+
+        n_epochs, n_channels, n_times = self.data.shape
+        self._csum = np.zeros((n_epochs, n_channels, n_times + 1))
+        np.cumsum(self.data, axis=2, out=self._csum[:, :, 1:])
+
+    @classmethod
+    def from_raw(cls, raw, events, event_id, channels, tmin=-0.2, tmax=0.8):
+        """
+        Epochs a filtered recording once over a set of channels, with the same settings as
+        `EegRecordSubject.find_amp_diff_2`.
+
+        :param raw: Filtered `mne.io.Raw` object.
+        :param events: Events array, as returned by `mne.events_from_annotations`.
+        :param event_id: Event name to ID mapping, as returned by `mne.events_from_annotations`.
+        :param channels: Union of all the channels that will be queried.
+        :param tmin: Start of the epochs (in seconds) relative to the event.
+        :param tmax: End of the epochs (in seconds) relative to the event.
+        """
+        epochs = mne.Epochs(raw, events=events, event_id=event_id, tmin=tmin, tmax=tmax,
+                            picks=list(dict.fromkeys(channels)), baseline=(None, 0))
+
+        # Keep the channels in the order the data comes out of MNE
+        return cls(epochs.get_data(), epochs.events[:, 2], epochs.times,
+                   epochs.info["sfreq"], epochs.ch_names)
+
+    def _window(self, tmin: float, tmax: float):
+        # Same sample index convention as find_amp_diff_2 (inclusive tmax sample)
+        n_times = len(self.times)
+        start = int((tmin - self.times[0]) * self.sfreq)
+        stop = int((tmax - self.times[0]) * self.sfreq) + 1
+        return min(max(start, 0), n_times), min(max(stop, 0), n_times)
+
+    def query(self, queries):
+        """
+        Computes the rare vs. frequent mean amplitude difference for many queries at once.
+
+        Parameters:
+        -----------
+        queries : iterable of (channels, rare_events, tmin, tmax)
+            Every query has the same meaning as the arguments of `find_amp_diff_2`.
+
+        Returns:
+        --------
+        pandas.DataFrame
+            One row per query with the columns `channels`, `rare_events`, `tmin`, `tmax`,
+            `n_rare`, `n_freq`, `mean_rare`, `mean_freq` and `amp_diff`.
+
+        Notes:
+        ------
+        - All the windows are read from the cumulative sum in one step, and the channel and
+          rare event selections are applied as masks, so the cost does not grow with the
+          number of samples in each window.
+        - Queries with no rare or no frequent epochs get NaN, like `np.mean` of an empty array.
+        """
+        queries = [(tuple(ch), tuple(rare), float(t0), float(t1)) for ch, rare, t0, t1 in queries]
+        if not queries:
+            return pd.DataFrame(columns=["channels", "rare_events", "tmin", "tmax", "n_rare",
+                                         "n_freq", "mean_rare", "mean_freq", "amp_diff"])
+
+        ch_index = {ch: i for i, ch in enumerate(self.channels)}
+        missing = {ch for q in queries for ch in q[0] if ch not in ch_index}
+        if missing:
+            raise ValueError(f"Channels {sorted(missing)} were not epoched")
+
+        windows = np.array([self._window(q[2], q[3]) for q in queries])
+        starts, stops = windows[:, 0], windows[:, 1]
+        lengths = stops - starts
+
+        # (queries, epochs, channels) window means
+        with np.errstate(invalid="ignore", divide="ignore"):
+            win_mean = (self._csum[:, :, stops] - self._csum[:, :, starts]) / lengths
+        win_mean = win_mean.transpose(2, 0, 1)
+
+        chan_mask = np.zeros((len(queries), len(self.channels)))
+        rare_mask = np.zeros((len(queries), len(self.event_ids)))
+        for i, (chs, rare, _, _) in enumerate(queries):
+            chan_mask[i, [ch_index[ch] for ch in chs]] = 1
+            rare_mask[i] = np.isin(self.event_ids, rare)
+        freq_mask = 1 - rare_mask
+
+        # Per query: sum over the selected epochs and channels of the window means
+        per_epoch = np.einsum("qec,qc->qe", win_mean, chan_mask)
+        n_chan = chan_mask.sum(axis=1)
+        n_rare = rare_mask.sum(axis=1)
+        n_freq = freq_mask.sum(axis=1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean_rare = np.einsum("qe,qe->q", per_epoch, rare_mask) / (n_rare * n_chan)
+            mean_freq = np.einsum("qe,qe->q", per_epoch, freq_mask) / (n_freq * n_chan)
+
+        return pd.DataFrame({
+            "channels": [q[0] for q in queries],
+            "rare_events": [q[1] for q in queries],
+            "tmin": [q[2] for q in queries],
+            "tmax": [q[3] for q in queries],
+            "n_rare": n_rare.astype(int),
+            "n_freq": n_freq.astype(int),
+            "mean_rare": mean_rare,
+            "mean_freq": mean_freq,
+            "amp_diff": mean_rare - mean_freq,
+        })
+
+    def epoch_amplitudes(self, channels, tmin: float, tmax: float):
+        """
+        Mean amplitude of every epoch over `channels` and the [tmin, tmax] window.
+
+        The mean of these values over the rare epochs minus their mean over the other epochs
+        is `amp_diff`, so resampling statistics can work on this vector alone.
+
+        :return: Array with one value per epoch, in the order of `event_ids`.
+        """
+        start, stop = self._window(tmin, tmax)
+        picks = [self.channels.index(ch) for ch in channels]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            window_means = (self._csum[:, picks, stop] - self._csum[:, picks, start]) / (stop - start)
+        return window_means.mean(axis=1)
+
+    def amp_diff(self, channels, rare_events, tmin: float, tmax: float):
+        """
+        Single query shortcut, equivalent to `find_amp_diff_2` on the same record.
+        """
+        return float(self.query([(channels, rare_events, tmin, tmax)])["amp_diff"].iloc[0])
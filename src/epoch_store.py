@@ -0,0 +1,395 @@
+import os
+import re
+import json
+from fractions import Fraction
+import numpy as np
+import mne
+import pandas as pd
+from scipy import signal
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from Subjects import EegRecordSubject
+from epoch_engine import EpochedRecord
+from checkpoint import CohortCheckpoint
+from dataset_index import PARTICIPANTS_FILE, get_index
+import profiling
+
+# Bumped when the stored content changes, so older entries are rebuilt
+STORE_VERSION = 1
+
+# Half-length of the anti-aliasing filter of `scipy.signal.resample_poly` (its default
+# window), in samples of the slower of the two rates
+_AA_HALF_LENGTH = 10
+
+
+def _resample_factors(source_sfreq: float, sfreq: float):
+    ratio = Fraction(sfreq / source_sfreq).limit_denominator(1000)
+    if ratio > 1:
+        raise ValueError(f"The store only decimates: {sfreq} Hz is above the {source_sfreq} Hz of the recording")
+    return ratio.numerator, ratio.denominator
+
+
+def decimate_epochs(record: EegRecordSubject, sfreq=250.0, channels=None, tmin=-0.2, tmax=0.8):
+    """
+    Epochs a filtered record and decimates the epochs to `sfreq`, baseline corrected, in float32.
+
+    The epochs are the ones `find_amp_diff_2` keeps (same events, same drops for the recording
+    edges and BAD annotations). Each epoch is cut with enough margin for the polyphase
+    anti-aliasing filter of `scipy.signal.resample_poly`, decimated, and cropped back to
+    [tmin, tmax]. The margins are aligned so that t=0 falls on a decimated sample: event
+    timing is kept exactly, whatever the ratio of the two rates.
+
+    :param record: Loaded (not lazy) `EegRecordSubject`.
+    :param sfreq: Target sampling rate. Any rate below the recording's works (e.g. 500 -> 200 Hz
+                  is a 2/5 polyphase resampling); it should stay above twice the 40 Hz low-pass.
+    :param channels: Channels to keep. Default: all channels of the record.
+    :return: An `EpochedRecord` with float32 data, so amplitude queries run on it unchanged.
+    """
+    raw = record.raw
+    channels = list(raw.ch_names if channels is None else dict.fromkeys(channels))
+    source_sfreq = raw.info["sfreq"]
+    up, down = _resample_factors(source_sfreq, sfreq)
+    sfreq = source_sfreq * up / down
+
+    # The epochs kept at the full rate (out of range and BAD segments dropped)
+    with profiling.stage("epoch"):
+        epochs = mne.Epochs(raw, events=record.events, event_id=record.event_id, tmin=tmin, tmax=tmax,
+                            picks=channels, baseline=None, preload=False, verbose=False)
+        epochs.drop_bad(verbose=False)
+    events = epochs.events
+
+    # Padded segment [start, stop] in source samples around each event, start a multiple of
+    # `down` so the decimated grid goes through the event sample
+    first, last = int(round(tmin * sfreq)), int(round(tmax * sfreq))
+    margin = _AA_HALF_LENGTH * max(up, down) // up + 1
+    start = -down * int(np.ceil((margin - first * down / up) / down))
+    stop = int(np.ceil(last * down / up)) + margin
+    offset = first - start * up // down  # Index of tmin in the decimated segment
+
+    # baseline=(None, 0) as in find_amp_diff_2, averaged over the full-rate samples. The
+    # baseline is a constant per epoch, which the decimation filter leaves unchanged, so
+    # subtracting it after decimation is exact and avoids the error of a coarser average.
+    base_start = int(round(tmin * source_sfreq)) - start
+
+    with profiling.stage("decimate") as stage:
+        data = raw.get_data(picks=channels)
+        idx = np.clip(events[:, 0, np.newaxis] - raw.first_samp + np.arange(start, stop + 1), 0, data.shape[1] - 1)
+        out = np.empty((len(events), len(channels), last - first + 1), dtype=np.float32)
+        for c in range(len(channels)):  # One channel at a time bounds the padded copy
+            segments = data[c, idx]
+            decimated = signal.resample_poly(segments, up, down, axis=-1)
+            baseline = segments[:, base_start:1 - start].mean(axis=1, keepdims=True)
+            out[:, c] = decimated[:, offset:offset + out.shape[2]] - baseline
+        stage.add_bytes(data.nbytes)
+
+    return EpochedRecord(out, events[:, 2], np.arange(first, last + 1) / sfreq, sfreq, channels)
+
+
+class EpochStore:
+    def __init__(self, store_dir: str, sfreq=250.0, tmin=-0.2, tmax=0.8, filter_method="mne"):
+        """
+        Persistent per-recording store of decimated, baseline corrected epochs.
+
+        Each recording is read, filtered and epoched once (`decimate_epochs`), and its epochs
+        are saved as float32 with their event codes in `<recording>.npz`. Amplitude, latency
+        and grand average queries then only read these small files; the .eeg data is never
+        touched again. An entry is rebuilt when the recording files change (sizes and
+        modification times), when the store settings change, or when it lacks a requested
+        channel.
+
+        Accuracy relative to the full-rate epochs (`check_accuracy` reports the error of each
+        query next to its bound):
+            - Decimated samples match the full-rate signal at the same times up to the ripple
+              of the anti-aliasing filter below the 40 Hz low-pass (about 1e-3 of the signal)
+              and the float32 rounding (2**-24 relative). The baseline is computed at the
+              full rate, so it adds no error.
+            - Mean window amplitudes (`amp_diff`) mostly differ because the window is averaged
+              on a coarser grid. A mean of samples is the average of the waveform over the
+              window widened by half a sample on each side, so both edges move by up to one
+              decimated step. With d the difference wave, M its window mean and L the window
+              length, the error is bounded by
+                  sum over the two edges of |edge shift| * max |d - M| near the edge / L
+                  + (step_full**2 + step**2) / 24 * max |d''|      (sampling of each grid)
+                  + filter ripple * max |d| + float32 term.
+              The first term dominates. It grows with the step and shrinks with the window
+              length, so short windows on steep flanks are the worst case.
+            - Peak latencies (`peak_latency`) are refined by parabolic interpolation, and their
+              error grows with the step. Below 250 Hz, when two local peaks of a window are
+              within a few % of each other, the other one can be picked.
+            - 250 Hz is the default. Use 125 Hz or less only for waveforms and grand averages.
+
+        :param store_dir: Directory of the entries. Created if missing.
+        :param sfreq: Sampling rate of the stored epochs.
+        :param tmin, tmax: Epoch limits in seconds, the same as `find_amp_diff_2` by default.
+        :param filter_method: Filtering engine used when building entries, see `filtering.METHODS`.
+        """
+        self.store_dir = store_dir
+        self.sfreq = sfreq
+        self.tmin = tmin
+        self.tmax = tmax
+        self.filter_method = filter_method
+        os.makedirs(store_dir, exist_ok=True)
+
+    def settings(self):
+        filter_settings = dict(EegRecordSubject.FILTER)
+        if self.filter_method != "mne":
+            filter_settings["method"] = self.filter_method
+        return {"version": STORE_VERSION, "sfreq": self.sfreq, "window": [self.tmin, self.tmax],
+                "baseline": [None, 0], "filter": filter_settings}
+
+    def entry_path(self, vhdr_path: str):
+        return os.path.join(self.store_dir, os.path.splitext(os.path.basename(vhdr_path))[0] + ".npz")
+
+    def _read_meta(self, entry: str):
+        with np.load(entry, allow_pickle=False) as f:
+            return json.loads(str(f["meta"]))
+
+    def is_current(self, vhdr_path: str, channels=None):
+        """
+        Checks whether the entry of a recording exists and can answer queries on `channels`.
+        Only the recording files are stat-ed.
+        """
+        entry = self.entry_path(vhdr_path)
+        try:
+            meta = self._read_meta(entry)
+        except (OSError, ValueError, KeyError):
+            return False
+        return (meta["settings"] == self.settings()
+                and meta["input_key"] == CohortCheckpoint.input_key(vhdr_path)
+                and set(channels or meta["channels"]) <= set(meta["channels"]))
+
+    def update(self, vhdr_path: str, channels=None, cache=None):
+        """
+        Builds the entry of a recording if it is missing or stale.
+
+        :param channels: Channels to store. Default: all channels of the recording.
+        :param cache: Optional `FilteredRawCache` used to load the filtered recording.
+        :return: Path of the entry.
+        """
+        entry = self.entry_path(vhdr_path)
+        if self.is_current(vhdr_path, channels):
+            return entry
+        if channels is not None and self.is_current(vhdr_path):
+            # Valid entry missing some channels: rebuild it with both sets
+            channels = self._read_meta(entry)["channels"] + list(channels)
+
+        record = EegRecordSubject(vhdr_path, cache=cache, filter_method=self.filter_method, channels=channels)
+        if record.raw is None:
+            raise RuntimeError(f"Could not load {vhdr_path}")
+        epoched = decimate_epochs(record, self.sfreq, channels, self.tmin, self.tmax)
+        meta = {
+            "settings": self.settings(),
+            "input_key": CohortCheckpoint.input_key(vhdr_path),
+            "file_path": os.path.abspath(vhdr_path),
+            "channels": epoched.channels,
+            "source_sfreq": record.raw.info["sfreq"],
+        }
+
+        # Write to a temporary file first so a concurrent reader never sees a partial entry
+        tmp = f"{entry}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            np.savez(f, data=epoched.data, event_ids=epoched.event_ids, times=epoched.times,
+                     channels=np.array(epoched.channels), meta=np.array(json.dumps(meta)))
+        os.replace(tmp, entry)
+        return entry
+
+    def get(self, vhdr_path: str, channels=None, cache=None):
+        """
+        Returns the stored epochs of a recording as an `EpochedRecord`, building them if needed.
+        """
+        return self.load(self.update(vhdr_path, channels, cache))
+
+    @staticmethod
+    def load(entry: str):
+        """
+        Reads a stored entry without checking it against the recording.
+
+        :return: An `EpochedRecord` (float32 data) with `query`, `amp_diff` and `epoch_amplitudes`.
+        """
+        with profiling.stage("store", nbytes=os.path.getsize(entry)):
+            with np.load(entry, allow_pickle=False) as f:
+                meta = json.loads(str(f["meta"]))
+                return EpochedRecord(f["data"], f["event_ids"], f["times"], meta["settings"]["sfreq"],
+                                     [str(ch) for ch in f["channels"]])
+
+    def entries(self):
+        """
+        Returns the paths of all stored entries, sorted by name.
+        """
+        return sorted(os.path.join(self.store_dir, name) for name in os.listdir(self.store_dir)
+                      if name.endswith(".npz"))
+
+    def records(self, task="visualoddball"):
+        """
+        Loads the stored entries of a task.
+
+        :return: Dict subject number -> `EpochedRecord`.
+        """
+        records = {}
+        for entry in self.entries():
+            match = re.match(r"sub-(\d+)_task-([^_]+)", os.path.basename(entry))
+            if match and match.group(2) == task:
+                records[int(match.group(1))] = self.load(entry)
+        return records
+
+    def build(self, path: str, task="visualoddball", max_files=0, channels=None, n_workers=None,
+              cache=None, participants_file=PARTICIPANTS_FILE):
+        """
+        Builds the missing or stale entries of a cohort in a process pool.
+
+        :return: List of the subject numbers whose entry is available. Failures are printed.
+        """
+        index = get_index(path, participants_file)
+        jobs = {i: index.vhdr_path(i, task) for i in index.subjects(task, max_files)}
+        todo = {i: file_path for i, file_path in jobs.items() if not self.is_current(file_path, channels)}
+        done = [i for i in jobs if i not in todo]
+
+        if todo:
+            with ProcessPoolExecutor(max_workers=n_workers) as pool:
+                futures = {pool.submit(self.update, file_path, channels, cache): i for i, file_path in todo.items()}
+                for future in as_completed(futures):
+                    i = futures[future]
+                    try:
+                        future.result()
+                        done.append(i)
+                    except Exception as e:
+                        print(f"Failed to load {todo[i]}: {type(e).__name__}: {e}")
+        return sorted(done)
+
+
+def evoked(record: EpochedRecord, channels, rare_events, which="diff"):
+    """
+    Average waveform of a record over `channels`.
+
+    :param which: "rare" (mean of the rare epochs), "freq" (mean of the other epochs) or
+                  "diff" (rare minus frequent, the difference wave behind `amp_diff`).
+    :return: Array with one value per sample of `record.times`.
+    """
+    picks = [record.channels.index(ch) for ch in channels]
+    is_rare = np.isin(record.event_ids, rare_events)
+    waves = {}
+    for name, mask in (("rare", is_rare), ("freq", ~is_rare)):
+        if which in (name, "diff"):
+            waves[name] = record.data[mask][:, picks].mean(axis=(0, 1), dtype=np.float64)
+    if which == "diff":
+        return waves["rare"] - waves["freq"]
+    if which not in waves:
+        raise ValueError(f"Unknown waveform {which!r}, expected 'rare', 'freq' or 'diff'")
+    return waves[which]
+
+
+def peak_latency(record: EpochedRecord, channels, rare_events, tmin: float, tmax: float,
+                 which="diff", polarity="pos"):
+    """
+    Latency and amplitude of the peak of an average waveform inside [tmin, tmax].
+
+    The peak sample is refined with a parabola through it and its two neighbours, which
+    recovers most of the precision lost by decimation.
+
+    :param polarity: "pos" for the maximum (e.g. P3b), "neg" for the minimum (e.g. N2).
+    :return: Tuple (latency in seconds, amplitude).
+    """
+    wave = evoked(record, channels, rare_events, which)
+    sign = 1.0 if polarity == "pos" else -1.0
+    inside = np.flatnonzero((record.times >= tmin - 1e-9) & (record.times <= tmax + 1e-9))
+    k = inside[np.argmax(sign * wave[inside])]
+    latency, amplitude = record.times[k], wave[k]
+    if inside[0] < k < inside[-1]:
+        y0, y1, y2 = wave[k - 1], wave[k], wave[k + 1]
+        curvature = y0 - 2 * y1 + y2
+        if curvature != 0:
+            shift = 0.5 * (y0 - y2) / curvature
+            latency += shift / record.sfreq
+            amplitude = y1 - 0.25 * (y0 - y2) * shift
+    return float(latency), float(amplitude)
+
+
+def grand_average(records, channels, rare_events, which="diff"):
+    """
+    Grand average waveform over subjects (every subject weighs the same).
+
+    :param records: Dict subject -> `EpochedRecord`, e.g. `EpochStore.records()`. All must
+                    share the same time axis.
+    :return: Tuple (times, mean waveform, standard error, number of subjects).
+    """
+    records = list(records.values()) if isinstance(records, dict) else list(records)
+    times = records[0].times
+    waves = []
+    for record in records:
+        if len(record.times) != len(times) or not np.allclose(record.times, times):
+            raise ValueError("All records must have the same time axis")
+        waves.append(evoked(record, channels, rare_events, which))
+    waves = np.array(waves)
+    sem = waves.std(axis=0, ddof=1) / np.sqrt(len(waves)) if len(waves) > 1 else np.full(len(times), np.nan)
+    return times, waves.mean(axis=0), sem, len(waves)
+
+
+def amp_error_bound(full: EpochedRecord, decimated: EpochedRecord, channels, rare_events, tmin: float, tmax: float):
+    """
+    Bound of |amp_diff(decimated) - amp_diff(full)| for one query, derived from the full-rate
+    difference wave (see `EpochStore` for the terms).
+
+    :param full: Full-rate epochs of a record, e.g. `EegRecordSubject.epoch_once`.
+    :param decimated: The same epochs from `decimate_epochs`.
+    """
+    d = evoked(full, channels, rare_events)
+    h_full, h = 1 / full.sfreq, 1 / decimated.sfreq
+    start, stop = full._window(tmin, tmax)
+    dec_start, dec_stop = decimated._window(tmin, tmax)
+    mean = d[start:stop].mean()
+    length = (stop - start) * h_full
+
+    # Edges of the averaged interval (half a sample outside the first and last samples)
+    edges = [(full.times[start] - h_full / 2, decimated.times[dec_start] - h / 2),
+             (full.times[stop - 1] + h_full / 2, decimated.times[dec_stop - 1] + h / 2)]
+    edge = 0.0
+    for a, b in edges:
+        near = (full.times >= min(a, b) - h_full) & (full.times <= max(a, b) + h_full)
+        edge += abs(b - a) * np.abs(d[near] - mean).max() / length
+
+    around = slice(max(start - 1, 0), min(stop + 1, len(d)))
+    curvature = np.abs(np.diff(d[around], 2)).max() / h_full ** 2 if stop - start > 1 else 0.0
+    sampling = (h_full ** 2 + h ** 2) / 24 * curvature
+
+    # Deviation from 1 of the gain of the `resample_poly` filter below the low-pass cutoff
+    up, down = _resample_factors(full.sfreq, decimated.sfreq)
+    n = max(up, down)
+    taps = signal.firwin(2 * _AA_HALF_LENGTH * n + 1, 1 / n, window=("kaiser", 5.0))
+    _, gain = signal.freqz(taps, worN=np.linspace(0, EegRecordSubject.FILTER["h_freq"], 64), fs=full.sfreq * up)
+    ripple = np.abs(np.abs(gain) - 1).max() * np.abs(d[start:stop]).max()
+
+    picks = [decimated.channels.index(ch) for ch in channels]
+    rounding = 2 * 2.0 ** -24 * np.abs(decimated.data[:, picks, dec_start:dec_stop]).max()
+    return float(edge + sampling + ripple + rounding)
+
+
+def check_accuracy(record: EegRecordSubject, queries, sfreq=250.0, polarity="pos"):
+    """
+    Compares the stored (decimated) epochs of a record to its full-rate epochs.
+
+    :param record: Loaded `EegRecordSubject`.
+    :param queries: Iterable of (channels, rare_events, tmin, tmax), as for `EpochedRecord.query`.
+    :return: DataFrame with one row per query: `amp_diff` at full rate and decimated, their
+             absolute and relative difference, the documented bound of the absolute difference
+             (`amp_error_bound`), and the peak latency difference (seconds) of the difference
+             wave in the window.
+    """
+    queries = [(list(ch), list(rare), tmin, tmax) for ch, rare, tmin, tmax in queries]
+    channels = list(dict.fromkeys(ch for q in queries for ch in q[0]))
+    full = record.epoch_once(channels)
+    decimated = decimate_epochs(record, sfreq, channels)
+    full_amp = full.query(queries)["amp_diff"].to_numpy()
+    dec_amp = decimated.query(queries)["amp_diff"].to_numpy()
+    latency = [peak_latency(decimated, *q, polarity=polarity)[0] - peak_latency(full, *q, polarity=polarity)[0]
+               for q in queries]
+    return pd.DataFrame({
+        "channels": [tuple(q[0]) for q in queries],
+        "rare_events": [tuple(q[1]) for q in queries],
+        "tmin": [q[2] for q in queries],
+        "tmax": [q[3] for q in queries],
+        "amp_diff_full": full_amp,
+        "amp_diff_store": dec_amp,
+        "abs_error": np.abs(dec_amp - full_amp),
+        "rel_error": np.abs(dec_amp - full_amp) / np.abs(full_amp),
+        "error_bound": [amp_error_bound(full, decimated, *q) for q in queries],
+        "latency_error": latency,
+    })
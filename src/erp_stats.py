@@ -0,0 +1,235 @@
+import contextlib
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+
+
+def _chunks(n: int, chunk_size: int, seed):
+    # Chunk sizes and independent random streams. They depend only on (n, chunk_size, seed),
+    # so the results are the same whatever the number of worker processes.
+    sizes = [min(chunk_size, n - start) for start in range(0, n, chunk_size)]
+    if not isinstance(seed, np.random.SeedSequence):
+        seed = np.random.SeedSequence(seed)
+    return sizes, seed.spawn(len(sizes))
+
+
+def _pool(n_jobs: int, executor=None):
+    # The given executor, else a pool for the duration of the call (None when serial), so
+    # every chunk run of one call shares the same worker processes
+    if executor is not None or n_jobs == 1:
+        return contextlib.nullcontext(executor)
+    return ProcessPoolExecutor(max_workers=n_jobs)
+
+
+def _run_chunks(func, n: int, chunk_size: int, seed, n_jobs: int, *args, executor=None):
+    sizes, seeds = _chunks(n, chunk_size, seed)
+    if len(sizes) == 1 or (executor is None and n_jobs == 1):
+        parts = [func(size, seq, *args) for size, seq in zip(sizes, seeds)]
+    else:
+        with _pool(n_jobs, executor) as pool:
+            parts = list(pool.map(func, sizes, seeds, *[[a] * len(sizes) for a in args]))
+    return np.concatenate(parts)
+
+
+def _bootstrap_chunk(size, seed_seq, rare_values, freq_values):
+    rng = np.random.default_rng(seed_seq)
+    rare = rare_values[rng.integers(0, len(rare_values), (size, len(rare_values)))].mean(axis=1)
+    freq = freq_values[rng.integers(0, len(freq_values), (size, len(freq_values)))].mean(axis=1)
+    return rare - freq
+
+
+def _permutation_chunk(size, seed_seq, values, n_rare):
+    rng = np.random.default_rng(seed_seq)
+    n = len(values)
+    order = rng.permuted(np.tile(np.arange(n), (size, 1)), axis=1)
+    rare_sum = values[order[:, :n_rare]].sum(axis=1)
+    return rare_sum / n_rare - (values.sum() - rare_sum) / (n - n_rare)
+
+
+def _group_bootstrap_chunk(size, seed_seq, values, codes, n_groups):
+    rng = np.random.default_rng(seed_seq)
+    means = np.empty((size, n_groups))
+    for g in range(n_groups):
+        group = values[codes == g]
+        means[:, g] = group[rng.integers(0, len(group), (size, len(group)))].mean(axis=1)
+    return means
+
+
+def _between_groups(sums, counts, total):
+    # Between-group sum of squares, the permutation equivalent of a one-way ANOVA F
+    grand = total / counts.sum()
+    return (counts * (sums / counts - grand) ** 2).sum(axis=-1)
+
+
+def _group_permutation_chunk(size, seed_seq, values, codes, n_groups):
+    rng = np.random.default_rng(seed_seq)
+    labels = rng.permuted(np.tile(codes, (size, 1)), axis=1)
+    one_hot = labels[:, :, np.newaxis] == np.arange(n_groups)
+    sums = np.einsum("snk,n->sk", one_hot, values)
+    counts = np.bincount(codes, minlength=n_groups)
+    return _between_groups(sums, counts, values.sum())
+
+
+def _percentile_ci(distribution, ci: float):
+    alpha = (1 - ci) / 2
+    return tuple(np.quantile(distribution, [alpha, 1 - alpha], axis=0))
+
+
+def bootstrap_amp_diff(values, is_rare, n_boot=10000, ci=0.95, seed=None, chunk_size=1000, n_jobs=1,
+                       executor=None):
+    """
+    Bootstrap confidence interval of one subject's amplitude difference, by trial resampling.
+
+    Rare and frequent epochs are resampled separately (with replacement, keeping their counts),
+    all resamples of a chunk in one array operation.
+
+    Parameters:
+        values (np.ndarray): Mean amplitude of every epoch (see `EpochedRecord.epoch_amplitudes`).
+        is_rare (np.ndarray): Boolean mask of the rare epochs.
+        n_boot (int): Number of bootstrap resamples.
+        ci (float): Confidence level of the percentile interval.
+        seed (int or np.random.SeedSequence, optional): Seed of the random generator, for
+                                                         reproducible results.
+        chunk_size (int): Resamples computed together; bounds the memory to about
+                          chunk_size x epochs indices.
+        n_jobs (int): Worker processes the chunks are spread over.
+        executor (concurrent.futures.Executor, optional): Pool to run the chunks on instead of
+                                                          starting one, e.g. shared by many calls.
+
+    Returns:
+        dict: `amp_diff` (observed), `se`, `ci` (low, high) and `distribution` (all resamples).
+    """
+    values = np.asarray(values, dtype=np.float64)
+    is_rare = np.asarray(is_rare, dtype=bool)
+    rare_values, freq_values = values[is_rare], values[~is_rare]
+    if not len(rare_values) or not len(freq_values):
+        raise ValueError("Both rare and frequent epochs are needed")
+
+    distribution = _run_chunks(_bootstrap_chunk, n_boot, chunk_size, seed, n_jobs, rare_values, freq_values,
+                               executor=executor)
+    return {
+        "amp_diff": rare_values.mean() - freq_values.mean(),
+        "se": distribution.std(ddof=1),
+        "ci": _percentile_ci(distribution, ci),
+        "distribution": distribution,
+    }
+
+
+def permutation_test_amp_diff(values, is_rare, n_perm=10000, seed=None, chunk_size=1000, n_jobs=1,
+                              executor=None):
+    """
+    Label permutation test of one subject's amplitude difference (two-sided).
+
+    The rare/frequent labels are shuffled between the epochs, keeping the number of rare
+    epochs, and the amplitude difference is recomputed for every permutation.
+
+    Parameters are the same as in `bootstrap_amp_diff`, with `n_perm` permutations.
+
+    Returns:
+        dict: `amp_diff` (observed), `p_value` and `distribution` (all permutations).
+              The p-value counts the observed labelling, so it is never 0.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    is_rare = np.asarray(is_rare, dtype=bool)
+    n_rare = int(is_rare.sum())
+    if not 0 < n_rare < len(values):
+        raise ValueError("Both rare and frequent epochs are needed")
+
+    observed = values[is_rare].mean() - values[~is_rare].mean()
+    distribution = _run_chunks(_permutation_chunk, n_perm, chunk_size, seed, n_jobs, values, n_rare,
+                               executor=executor)
+    extreme = np.sum(np.abs(distribution) >= abs(observed) - 1e-12 * abs(observed))
+    return {
+        "amp_diff": observed,
+        "p_value": (extreme + 1) / (n_perm + 1),
+        "distribution": distribution,
+    }
+
+
+def subject_stats(record, channels, rare_events, tmin: float, tmax: float, n_boot=10000, n_perm=10000,
+                  ci=0.95, seed=None, chunk_size=1000, n_jobs=1, executor=None):
+    """
+    Bootstrap interval and permutation p-value of a subject, from its cached epochs.
+
+    :param record: `EpochedRecord` of the subject (see `EegRecordSubject.epoch_once`).
+    :param executor: Pool to run the chunks on. If not given and `n_jobs` > 1, one pool is
+                     started for both the bootstrap and the permutations.
+    :return: Dict with `amp_diff`, `n_rare`, `n_freq`, `se`, `ci_low`, `ci_high` and `p_value`.
+    """
+    values = record.epoch_amplitudes(channels, tmin, tmax)
+    is_rare = np.isin(record.event_ids, rare_events)
+    # Independent streams, so the permutations are not correlated with the resamples
+    boot_seed, perm_seed = np.random.SeedSequence(seed).spawn(2)
+    with _pool(n_jobs, executor) as pool:
+        boot = bootstrap_amp_diff(values, is_rare, n_boot, ci, boot_seed, chunk_size, n_jobs, pool)
+        perm = permutation_test_amp_diff(values, is_rare, n_perm, perm_seed, chunk_size, n_jobs, pool)
+    return {
+        "amp_diff": boot["amp_diff"],
+        "n_rare": int(is_rare.sum()),
+        "n_freq": int((~is_rare).sum()),
+        "se": boot["se"],
+        "ci_low": boot["ci"][0],
+        "ci_high": boot["ci"][1],
+        "p_value": perm["p_value"],
+    }
+
+
+def cohort_subject_stats(records, channels, rare_events, tmin: float, tmax: float, **kwargs):
+    """
+    `subject_stats` of many subjects.
+
+    :param records: Dict subject number -> `EpochedRecord`.
+    :param kwargs: Passed to `subject_stats` (n_boot, n_perm, ci, seed, chunk_size, n_jobs,
+                   executor). With `n_jobs` > 1 and no executor, one pool serves all the subjects.
+    :return: DataFrame with one row per subject.
+    """
+    rows = []
+    with _pool(kwargs.get("n_jobs", 1), kwargs.pop("executor", None)) as pool:
+        for subject in sorted(records):
+            row = subject_stats(records[subject], channels, rare_events, tmin, tmax, executor=pool, **kwargs)
+            rows.append({"subject": subject, **row})
+    return pd.DataFrame(rows)
+
+
+def group_stats(values, groups, n_boot=10000, n_perm=10000, ci=0.95, seed=None, chunk_size=1000, n_jobs=1,
+                executor=None):
+    """
+    Compares subject amplitude differences between groups (e.g. education or income levels).
+
+    Each group mean gets a bootstrap interval (subjects resampled within their group), and a
+    permutation test of the group labels tests whether the group means differ, with the
+    between-group sum of squares as statistic (for two groups, a two-sided test of the mean
+    difference).
+
+    Parameters:
+        values (array-like): Amplitude difference of every subject. NaN values are dropped.
+        groups (array-like): Group of every subject, e.g. `df["Highest_Adult_Edu"]`.
+        Other parameters are the same as in `bootstrap_amp_diff`.
+
+    Returns:
+        tuple: (DataFrame with one row per group: `group`, `n`, `mean`, `ci_low`, `ci_high`,
+               p-value of the permutation test).
+    """
+    values = np.asarray(values, dtype=np.float64)
+    groups = pd.Series(groups).to_numpy()
+    keep = ~np.isnan(values) & ~pd.isna(groups)
+    values, groups = values[keep], groups[keep]
+    names, codes = np.unique(groups, return_inverse=True)
+    if len(names) < 2:
+        raise ValueError("At least two groups are needed")
+
+    counts = np.bincount(codes, minlength=len(names))
+    sums = np.bincount(codes, weights=values, minlength=len(names))
+    boot_seed, perm_seed = np.random.SeedSequence(seed).spawn(2)
+    with _pool(n_jobs, executor) as pool:
+        boot = _run_chunks(_group_bootstrap_chunk, n_boot, chunk_size, boot_seed, n_jobs, values, codes,
+                           len(names), executor=pool)
+        distribution = _run_chunks(_group_permutation_chunk, n_perm, chunk_size, perm_seed, n_jobs,
+                                   values, codes, len(names), executor=pool)
+    low, high = _percentile_ci(boot, ci)
+
+    observed = _between_groups(sums, counts, values.sum())
+    p_value = (np.sum(distribution >= observed * (1 - 1e-12)) + 1) / (n_perm + 1)
+
+    table = pd.DataFrame({"group": names, "n": counts, "mean": sums / counts, "ci_low": low, "ci_high": high})
+    return table, p_value
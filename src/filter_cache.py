@@ -0,0 +1,148 @@
+import os
+import hashlib
+import numpy as np
+import mne
+import filtering
+
+
+class FilteredRawCache:
+    def __init__(self, cache_dir: str, max_bytes=10 * 1024 ** 3):
+        """
+        Persistent on-disk cache of band-pass filtered BrainVision recordings.
+
+        The filtered signal is stored as a .npy file so it can be memory-mapped back, which
+        turns a repeated load + FIR filter into a header read and a memory map. Entries are
+        keyed by the .vhdr/.eeg paths, sizes and modification times and by the filter settings,
+        so editing a recording or changing the band always produces a miss.
+
+        Least recently used entries are evicted once the cache grows beyond `max_bytes`.
+        The last use of an entry is tracked by its file modification time, which keeps the
+        cache safe to share between the worker processes of a cohort run.
+
+        :param cache_dir: Directory holding the cached arrays. Created if missing.
+        :param max_bytes: Size cap of the cache in bytes.
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def key(self, vhdr_path: str, l_freq, h_freq, fir_design: str, method="mne"):
+        """
+        Returns the cache key of a recording filtered with the given settings.
+        """
+        raw = mne.io.read_raw_brainvision(vhdr_path, preload=False, verbose=False)
+        parts = [mne.__version__, repr(l_freq), repr(h_freq), fir_design]
+        if method != "mne":
+            parts.append(method)  # Keys of the default engine stay those of older caches
+        for path in [vhdr_path] + list(raw.filenames):
+            path = os.path.abspath(str(path))
+            st = os.stat(path)
+            parts += [path, str(st.st_size), str(st.st_mtime_ns)]
+        return hashlib.sha1("|".join(parts).encode("utf-8")).hexdigest(), raw
+
+    def load(self, vhdr_path: str, l_freq=0.1, h_freq=40, fir_design='firwin', method="mne"):
+        """
+        Returns the filtered raw recording, from the cache when possible.
+
+        On a miss the recording is loaded, filtered and stored before it is returned.
+        On a hit the data is memory-mapped copy-on-write, so the returned `Raw` can
+        still be modified in memory without touching the cache.
+
+        :param method: Filtering engine used on a miss, see `filtering.METHODS`.
+        :return: An `mne.io.Raw` object with the filtered data loaded.
+        """
+        key, header = self.key(vhdr_path, l_freq, h_freq, fir_design, method)
+        entry = os.path.join(self.cache_dir, key + ".npy")
+
+        if os.path.exists(entry):
+            try:
+                data = np.load(entry, mmap_mode='c')
+                os.utime(entry)  # Mark as recently used
+                self.hits += 1
+                return self._raw_from_data(header, data, l_freq, h_freq)
+            except (OSError, ValueError):
+                # Truncated or unreadable entry, rebuild it
+                pass
+
+        self.misses += 1
+        raw = mne.io.read_raw_brainvision(vhdr_path, preload=True)
+        filtering.filter_raw(raw, l_freq, h_freq, method=method, fir_design=fir_design)
+        self._store(entry, raw.get_data())
+        return raw
+
+    def _raw_from_data(self, header, data, l_freq, h_freq):
+        info = header.info.copy()
+        with info._unlock():
+            info["highpass"] = float(l_freq) if l_freq is not None else 0.0
+            info["lowpass"] = float(h_freq) if h_freq is not None else info["sfreq"] / 2.0
+        raw = mne.io.RawArray(data, info, first_samp=header.first_samp, verbose=False)
+        raw.set_annotations(header.annotations)
+        return raw
+
+    def _store(self, entry, data):
+        # Write to a temporary file first so a concurrent reader never sees a partial entry
+        tmp = f"{entry}.{os.getpid()}.tmp"
+        try:
+            with open(tmp, "wb") as f:
+                np.save(f, data)
+            os.replace(tmp, entry)
+        except OSError as e:
+            print(f"Could not write cache entry {entry}: {e}")
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            return
+        self.evict()
+
+    def entries(self):
+        """
+        Returns (path, size, last_used) for every entry, least recently used first.
+        """
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(".npy"):
+                path = os.path.join(self.cache_dir, name)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue  # Removed by another process
+                entries.append((path, st.st_size, st.st_mtime))
+        return sorted(entries, key=lambda e: e[2])
+
+    def size(self):
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self):
+        """
+        Removes least recently used entries until the cache fits in `max_bytes`.
+
+        Entries that cannot be removed (e.g. still memory-mapped by a loaded record on Windows,
+        where mapped files are locked) are skipped and the next ones are evicted instead.
+        """
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for path, size, _ in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass  # Removed by another process
+            except OSError:
+                continue  # In use; it still takes its space
+            total -= size
+
+    def clear(self):
+        """
+        Removes every entry, except those that cannot be removed (see `evict`).
+        """
+        for path, _, _ in self.entries():
+            try:
+                os.remove(path)
+            except OSError:
+                pass  # Removed by another process, or in use
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses,
+                "entries": len(self.entries()), "bytes": self.size()}
@@ -1,88 +1,145 @@
 import os  # Import the 'os' module, which provides functions for interacting with the operating system, like working with files and directories.
+import sys  # Import the 'sys' module, used to read the command line arguments.
+import shutil  # Import the 'shutil' module, used to copy the file permissions to the temporary file.
+import tempfile  # Import the 'tempfile' module, used to create the temporary files of the atomic writes.
+from concurrent.futures import ThreadPoolExecutor  # Thread pool used to repair many files at the same time (the work is I/O bound).
 
-def fix_eeg_filenames(base_dir):
+def find_brainvision_files(base_dir):
     """
-    This function iterates through the subject folders and calls the appropriate processing function
-    for each .vhdr and .vmrk file found within the 'eeg' subfolder.
+    This function discovers every .vhdr and .vmrk file of the dataset, instead of assuming a fixed
+    range of subject numbers.
 
     Args:
-        base_dir (str): The base directory where the subject folders ('sub-001' to 'sub-127') are located.
-    """
-    for sub_num in range(1, 128):  # Loop through the numbers 1 to 127 (inclusive) to generate the subject folder names.
-        sub_folder = f"sub-{sub_num:03d}"  # Create the subject folder name (e.g., 'sub-001', 'sub-002', etc.). The ':03d' ensures the number is always three digits with leading zeros.
-        eeg_folder = os.path.join(base_dir, sub_folder, "eeg")  # Construct the full path to the 'eeg' subfolder within the current subject folder.
-
-        if not os.path.exists(eeg_folder):  # Check if the 'eeg' folder actually exists.
-          print(f"eeg folder not found in {sub_folder}")  # If the folder doesn't exist, print a message.
-          continue  # Skip to the next iteration of the loop (next subject folder).
+        base_dir (str): The base directory where the subject folders ('sub-XXX') are located.
 
-        for filename in os.listdir(eeg_folder):  # Loop through all the files and folders within the 'eeg' folder.
-            file_path = os.path.join(eeg_folder, filename)  # Construct the full path to the current file.
-            if filename.endswith(".vhdr"):  # Check if the filename ends with '.vhdr'.
-                process_vhdr(file_path, sub_folder)  # If it's a .vhdr file, call the 'process_vhdr' function to fix it.
-            elif filename.endswith(".vmrk"):  # Check if the filename ends with '.vmrk'.
-                process_vmrk(file_path, sub_folder)  # If it's a .vmrk file, call the 'process_vmrk' function to fix it.
-
-def process_vhdr(vhdr_path, sub_folder):
+    Returns:
+        list[tuple]: (file path, subject folder name) for every .vhdr and .vmrk file found.
     """
-    This function processes a single .vhdr file to correct the 'DataFile=' and 'MarkerFile=' lines.
+    files = []  # List of (file path, subject folder) pairs to repair.
+    with os.scandir(base_dir) as entries:  # Scan the base directory once.
+        for entry in sorted(entries, key=lambda e: e.name):  # Sorted so the report is in subject order.
+            if not (entry.name.startswith("sub-") and entry.is_dir()):  # Only subject folders are of interest.
+                continue
+            eeg_folder = os.path.join(entry.path, "eeg")  # Construct the full path to the 'eeg' subfolder.
+            if not os.path.isdir(eeg_folder):  # Check if the 'eeg' folder actually exists.
+                print(f"eeg folder not found in {entry.name}")  # If the folder doesn't exist, print a message.
+                continue
+            for filename in sorted(os.listdir(eeg_folder)):  # Loop through all the files within the 'eeg' folder.
+                if filename.endswith((".vhdr", ".vmrk")) and "_task-" in filename:  # Only BrainVision header and marker files.
+                    files.append((os.path.join(eeg_folder, filename), entry.name))
+    return files
+
+def fixed_lines(lines, file_path, sub_folder):
+    """
+    This function returns the lines of a .vhdr or .vmrk file with corrected 'DataFile=' and
+    (for .vhdr files) 'MarkerFile=' lines. The original line endings are kept.
 
     Args:
-        vhdr_path (str): The full path to the .vhdr file.
+        lines (list[str]): The lines of the file, read with their line endings.
+        file_path (str): The full path to the file.
         sub_folder (str): The name of the parent subject folder (e.g., 'sub-001').
     """
-    try:  # Start a 'try' block to handle potential errors during file processing.
-        with open(vhdr_path, 'r', encoding='utf-8') as f:  # Open the .vhdr file in read mode ('r') with UTF-8 encoding to handle various characters. The 'with' statement ensures the file is automatically closed.
-            lines = f.readlines()  # Read all lines from the file and store them in a list called 'lines'.
-
-        vhdr_filename = os.path.basename(vhdr_path)  # Extract the filename from the full path (e.g., 'sub-011_task-visualoddball_eeg.vhdr').
-        task_name = vhdr_filename.split('_task-')[1].split('_eeg')[0]  # Extract the task name from the filename. It splits the filename at '_task-', takes the part after that, and then splits that part at '_eeg' to get the task name in between.
-
-        correct_eeg_filename = f"{sub_folder}_task-{task_name}_eeg.eeg"  # Construct the correct .eeg filename based on the subject folder and task name.
-        correct_vmrk_filename = f"{sub_folder}_task-{task_name}_eeg.vmrk"  # Construct the correct .vmrk filename based on the subject folder and task name.
-
-        for i, line in enumerate(lines):  # Loop through each line in the 'lines' list, keeping track of the line index 'i'.
-            if line.startswith("DataFile="):  # Check if the current line starts with 'DataFile='.
-                lines[i] = f"DataFile={correct_eeg_filename}\n"  # If it does, replace the line with the correct 'DataFile=' line, including a newline character at the end.
-            elif line.startswith("MarkerFile="):  # Check if the current line starts with 'MarkerFile='.
-                lines[i] = f"MarkerFile={correct_vmrk_filename}\n"  # If it does, replace the line with the correct 'MarkerFile=' line, including a newline character at the end.
-
-        with open(vhdr_path, 'w', newline='\n', encoding='utf-8') as f:  # Open the same .vhdr file again, but this time in write mode ('w'). 'newline='\n'' ensures consistent newline characters, and 'encoding='utf-8'' handles encoding.
-            f.writelines(lines)  # Write the modified 'lines' list back to the file, overwriting the original content.
-
-        print(f"Fixed filenames in {vhdr_path}")  # Print a message indicating that the file has been processed.
-
-    except Exception as e:  # If any error occurs within the 'try' block, this block will catch it.
-        print(f"Error processing {vhdr_path}: {e}")  # Print an error message, including the specific error that occurred.
-
-def process_vmrk(vmrk_path, sub_folder):
+    filename = os.path.basename(file_path)  # Extract the filename from the full path (e.g., 'sub-011_task-visualoddball_eeg.vhdr').
+    task_name = filename.split('_task-')[1].split('_eeg')[0]  # Extract the task name, between '_task-' and '_eeg'.
+
+    correct = {
+        "DataFile=": f"{sub_folder}_task-{task_name}_eeg.eeg",  # The correct .eeg filename based on the subject folder and task name.
+    }
+    if filename.endswith(".vhdr"):  # Only header files point to the marker file.
+        correct["MarkerFile="] = f"{sub_folder}_task-{task_name}_eeg.vmrk"
+
+    new_lines = []
+    for line in lines:  # Loop through each line of the file.
+        body = line.rstrip("\r\n")  # The line without its line ending.
+        ending = line[len(body):]  # The line ending itself ('\r\n', '\n' or '' on the last line).
+        for key, value in correct.items():
+            if body.startswith(key):  # Check if the line is one of the lines to correct.
+                body = key + value  # Replace it with the correct line.
+        new_lines.append(body + ending)
+    return new_lines
+
+def repair_file(file_path, sub_folder, dry_run=False):
     """
-    This function processes a single .vmrk file to correct the 'DataFile=' line.
+    This function repairs a single .vhdr or .vmrk file. The file is only rewritten if its content
+    changes, and the new content is written to a temporary file that then replaces the original,
+    so the file is never left half written.
 
     Args:
-        vmrk_path (str): The full path to the .vmrk file.
+        file_path (str): The full path to the .vhdr or .vmrk file.
         sub_folder (str): The name of the parent subject folder (e.g., 'sub-001').
+        dry_run (bool): If True, only report whether the file would be changed.
+
+    Returns:
+        tuple: (file path, status) where status is 'unchanged', 'fixed', 'would fix' or an error message.
     """
     try:  # Start a 'try' block to handle potential errors during file processing.
-        with open(vmrk_path, 'r', encoding='utf-8') as f:  # Open the .vmrk file in read mode ('r') with UTF-8 encoding.
+        with open(file_path, 'r', encoding='utf-8', newline='') as f:  # newline='' keeps the original line endings.
             lines = f.readlines()  # Read all lines from the file.
 
-        vmrk_filename = os.path.basename(vmrk_path)  # Extract the filename from the full path.
-        task_name = vmrk_filename.split('_task-')[1].split('_eeg')[0]  # Extract the task name from the filename.
+        new_lines = fixed_lines(lines, file_path, sub_folder)
+        if new_lines == lines:  # Nothing to correct, so don't touch the file at all.
+            return file_path, "unchanged"
+        if dry_run:
+            return file_path, "would fix"
+
+        folder = os.path.dirname(file_path)
+        fd, tmp_path = tempfile.mkstemp(dir=folder, prefix=".tmp-", suffix=os.path.basename(file_path))  # Temporary file in the same folder, so the rename stays on one file system.
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8', newline='') as f:
+                f.writelines(new_lines)  # Write the corrected lines to the temporary file.
+            shutil.copymode(file_path, tmp_path)  # Keep the permissions of the original file.
+            os.replace(tmp_path, file_path)  # Atomically replace the original file.
+        except BaseException:
+            os.remove(tmp_path)  # Don't leave the temporary file behind.
+            raise
+        return file_path, "fixed"
 
-        correct_eeg_filename = f"{sub_folder}_task-{task_name}_eeg.eeg"  # Construct the correct .eeg filename.
+    except Exception as e:  # If any error occurs within the 'try' block, this block will catch it.
+        return file_path, f"error: {e}"
 
-        for i, line in enumerate(lines):  # Loop through each line.
-            if line.startswith("DataFile="):  # Check if the line starts with 'DataFile='.
-                lines[i] = f"DataFile={correct_eeg_filename}\n"  # Replace the line with the correct 'DataFile=' line.
+def process_vhdr(vhdr_path, sub_folder):
+    """
+    This function repairs a single .vhdr file (kept for compatibility, see `repair_file`).
+    """
+    print(" ".join(repair_file(vhdr_path, sub_folder)[::-1]))
 
-        with open(vmrk_path, 'w', newline='\n', encoding='utf-8') as f:  # Open the .vmrk file in write mode, ensuring consistent newline characters and UTF-8 encoding.
-            f.writelines(lines)  # Write the modified lines back to the file.
+def process_vmrk(vmrk_path, sub_folder):
+    """
+    This function repairs a single .vmrk file (kept for compatibility, see `repair_file`).
+    """
+    print(" ".join(repair_file(vmrk_path, sub_folder)[::-1]))
 
-        print(f"Fixed filenames in {vmrk_path}")  # Print a success message.
+def fix_eeg_filenames(base_dir, dry_run=False, max_workers=16):
+    """
+    This function repairs the 'DataFile=' and 'MarkerFile=' lines of every .vhdr and .vmrk file of
+    the dataset, across a thread pool.
 
-    except Exception as e:  # Catch any errors.
-        print(f"Error processing {vmrk_path}: {e}")  # Print an error message.
+    Args:
+        base_dir (str): The base directory where the subject folders ('sub-XXX') are located.
+        dry_run (bool): If True, no file is written and the report lists the files that would change.
+        max_workers (int): The number of threads. Most of the time goes to file I/O, which
+                           overlaps well on network-mounted storage.
 
-base_directory = "."  # Set the base directory to the current directory. You can change this if your subject folders are located elsewhere.
-fix_eeg_filenames(base_directory)  # Call the main function to start the process, using the specified base directory.
+    Returns:
+        list[tuple]: (file path, status) for every file found, see `repair_file`.
+    """
+    files = find_brainvision_files(base_dir)
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        report = list(pool.map(lambda args: repair_file(*args, dry_run=dry_run), files))
+
+    for file_path, status in report:  # Print every file that was (or would be) changed or failed.
+        if status != "unchanged":
+            print(f"{status}: {file_path}")
+
+    counts = {}
+    for _, status in report:
+        key = "error" if status.startswith("error") else status
+        counts[key] = counts.get(key, 0) + 1
+    print(f"{len(report)} files checked: " + ", ".join(f"{n} {k}" for k, n in sorted(counts.items())))
+    return report
+
+if __name__ == "__main__":
+    # Usage: python fix_vhdr_com.py [base_dir] [--dry-run]
+    args = [a for a in sys.argv[1:] if a != "--dry-run"]
+    base_directory = args[0] if args else "."  # The base directory defaults to the current directory.
+    fix_eeg_filenames(base_directory, dry_run="--dry-run" in sys.argv[1:])
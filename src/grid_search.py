@@ -0,0 +1,156 @@
+import itertools
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from Subjects import EegRecordSubject
+from dataset_index import PARTICIPANTS_FILE, get_index
+from checkpoint import CohortCheckpoint, GridCheckpoint, GRID_COLUMNS
+
+
+def param_grid(channel_sets, windows, rare_event_sets):
+    """
+    Returns every (channels, rare_events, tmin, tmax) combination of the given lists.
+
+    Example: `param_grid([["Pz", "P3", "P4"], ["Fz"]], [(0.3, 0.6), (0.125, 0.225)], [[201, 202]])`
+    """
+    return [(list(channels), list(rare), tmin, tmax)
+            for channels, (tmin, tmax), rare in itertools.product(channel_sets, windows, rare_event_sets)]
+
+
+def _filter_settings(filter_method):
+    settings = dict(EegRecordSubject.FILTER)
+    if filter_method != "mne":
+        settings["method"] = filter_method
+    return settings
+
+
+def _grid_job(file_path: str, queries, cache=None, lazy=False, filter_method="mne"):
+    """
+    Worker entry point: loads and epochs one EEG record once over the union of the queried
+    channels, and answers all its queries. Returns the cell values in query order.
+    """
+    channels = list(dict.fromkeys(ch for query in queries for ch in query[0]))
+    eeg_r = EegRecordSubject(file_path, cache=cache, lazy=lazy, filter_method=filter_method, channels=channels)
+    if eeg_r.raw is None:
+        raise RuntimeError(f"Could not load {file_path}")
+    result = eeg_r.epoch_once(channels).query(queries)
+    return [tuple(row) for row in result[GRID_COLUMNS].itertuples(index=False)]
+
+
+def grid_search(path: str, channel_sets, windows, rare_event_sets, checkpoint, task="visualoddball", max_files=0, n_workers=None,
+                participants_file=PARTICIPANTS_FILE, cache=None, lazy=False, filter_method="mne"):
+    """
+    Computes the amplitude difference of every subject for every cell of a parameter grid
+    (every combination of a channel set, a window and a rare event definition).
+
+    The cells already stored in `checkpoint` for a subject (with unchanged recording files) are
+    reused. For the others, the subject is loaded and epoched once over the union of their
+    channels, and all its missing cells are answered from that single set of epochs
+    (`EpochedRecord.query`). Subjects run in a process pool, and every subject's new cells
+    are committed to the checkpoint as soon as they arrive. If a worker process dies, the
+    subjects that were in flight are retried one by one in isolated processes, as in
+    `cohort_runner.iter_amp_diff_data`, and only the one that crashes again is skipped.
+
+    Parameters:
+        path (str): The root directory containing the EEG data.
+        channel_sets (list[list[str]]): Regions of interest, e.g. [["Pz", "P3", "P4"], ["Fz", "F3", "F4"]].
+        windows (list[tuple]): (tmin, tmax) windows in seconds, e.g. [(0.3, 0.6), (0.125, 0.225)].
+        rare_event_sets (list[list]): Rare event definitions, e.g. [[201, 202]].
+        checkpoint (GridCheckpoint): Memo the cells are read from and added to.
+        task (str, optional): Task name as it appears in the file names. Default is "visualoddball".
+        max_files (int, optional): The highest subject number to process.
+                                   If 0, processes all available participants.
+        n_workers (int, optional): Number of worker processes. Defaults to `os.cpu_count()`.
+        participants_file (str, optional): Path to the participants demographic table.
+        cache (FilteredRawCache, optional): Cache of filtered recordings shared by the workers.
+        lazy (bool, optional): Load the records in lazy, memory-mapped mode.
+        filter_method (str, optional): Filtering engine, see `filtering.METHODS`. Default is "mne".
+
+    Returns:
+        pandas.DataFrame: One row per (subject, cell) with the columns `subject`, `channels`,
+                          `rare_events`, `tmin`, `tmax`, `n_rare`, `n_freq`, `mean_rare`,
+                          `mean_freq` and `amp_diff`. Subjects that fail are printed and skipped.
+    """
+    index = get_index(path, participants_file)
+    grid = [(tuple(channels), tuple(rare), float(tmin), float(tmax))
+            for channels, rare, tmin, tmax in param_grid(channel_sets, windows, rare_event_sets)]
+    settings = _filter_settings(filter_method)
+    keys = [GridCheckpoint.query_key(*cell, settings) for cell in grid]
+
+    values, todo = {}, {}
+    for i in index.subjects(task, max_files):
+        file_path = index.vhdr_path(i, task)
+        input_key = CohortCheckpoint.input_key(file_path)
+        stored = checkpoint.get_many(task, i, input_key, keys)
+        values[i] = [stored.get(key) for key in keys]
+        missing = [c for c, cell in enumerate(values[i]) if cell is None]
+        if missing:
+            todo[i] = (file_path, input_key, missing)
+
+    def commit(i, cells):
+        _, input_key, missing = todo[i]
+        checkpoint.put_many(task, i, input_key, [(keys[c], cell) for c, cell in zip(missing, cells)])
+        for c, cell in zip(missing, cells):
+            values[i][c] = cell
+
+    def fail(i, error):
+        print(f"Failed to load {todo[i][0]}: {error}")
+        del values[i]
+
+    suspects = []
+    if todo:
+        with ProcessPoolExecutor(max_workers=n_workers) as pool:
+            futures = {pool.submit(_grid_job, file_path, [grid[c] for c in missing], cache, lazy, filter_method): i
+                       for i, (file_path, _, missing) in todo.items()}
+            for future in as_completed(futures):
+                i = futures[future]
+                try:
+                    cells = future.result()
+                except BrokenProcessPool:
+                    suspects.append(i)
+                    continue
+                except Exception as e:
+                    fail(i, f"{type(e).__name__}: {e}")
+                    continue
+                commit(i, cells)
+
+    # A dead worker breaks the whole pool, so every subject still pending at that moment
+    # lands here. Re-run each of them alone to find the one that actually crashes.
+    for i in sorted(suspects):
+        file_path, _, missing = todo[i]
+        with ProcessPoolExecutor(max_workers=1) as pool:
+            try:
+                cells = pool.submit(_grid_job, file_path, [grid[c] for c in missing], cache, lazy, filter_method).result()
+            except BrokenProcessPool:
+                fail(i, "worker process crashed")
+                continue
+            except Exception as e:
+                fail(i, f"{type(e).__name__}: {e}")
+                continue
+        commit(i, cells)
+
+    subjects = sorted(values)
+    rows = np.array([cell for i in subjects for cell in values[i]], dtype=float).reshape(-1, len(GRID_COLUMNS))
+    df = pd.DataFrame(rows, columns=GRID_COLUMNS)
+    df.insert(0, "subject", np.repeat(subjects, len(grid)))
+    df.insert(1, "channels", [cell[0] for _ in subjects for cell in grid])
+    df.insert(2, "rare_events", [cell[1] for _ in subjects for cell in grid])
+    df.insert(3, "tmin", np.tile([cell[2] for cell in grid], len(subjects)))
+    df.insert(4, "tmax", np.tile([cell[3] for cell in grid], len(subjects)))
+    df[["n_rare", "n_freq"]] = df[["n_rare", "n_freq"]].astype(int)
+    return df
+
+
+def summarize_grid(df):
+    """
+    Ranks the grid cells by how consistent the amplitude difference is across subjects.
+
+    :param df: Output of `grid_search`.
+    :return: DataFrame with one row per cell: `n_subjects`, `mean`, `std` and the one-sample
+             t statistic `t` (mean / standard error), sorted by decreasing `t`.
+    """
+    grouped = df.dropna(subset=["amp_diff"]).groupby(["channels", "rare_events", "tmin", "tmax"], sort=False)
+    summary = grouped["amp_diff"].agg(n_subjects="count", mean="mean", std="std").reset_index()
+    summary["t"] = summary["mean"] / (summary["std"] / np.sqrt(summary["n_subjects"]))
+    return summary.sort_values("t", ascending=False, ignore_index=True)
@@ -0,0 +1,160 @@
+import numpy as np
+from brainvision import read_vhdr
+import profiling
+import filtering
+
+# Bytes of the .eeg file mapped at a time when reading interleaved (MULTIPLEXED) samples
+READ_BLOCK = 4 * 1024 * 1024
+
+
+class LazyEegData:
+    def __init__(self, vhdr_path: str, l_freq=0.1, h_freq=40, fir_design='firwin', chunk_seconds=120.0,
+                 method="mne"):
+        """
+        Memory-mapped access to the samples of a BrainVision recording.
+
+        Nothing is read when the object is created. Epochs are built by reading only the
+        requested channels around the requested events, in padded chunks that are filtered
+        one at a time, so the memory use depends on the chunk size and the number of picked
+        channels instead of on the length and width of the recording.
+
+        :param vhdr_path: Path to the .vhdr file.
+        :param l_freq, h_freq, fir_design: Band-pass filter, same meaning as in `mne.io.Raw.filter`.
+        :param chunk_seconds: Maximal span of events filtered together, without the padding.
+        :param method: Filtering engine, see `filtering.METHODS`. With "iir" the padding is long
+                       enough for the response to decay, but chunks are not bit-identical to
+                       filtering the whole recording.
+        """
+        self.header = read_vhdr(vhdr_path)
+        self.sfreq = self.header["sfreq"]
+        self.ch_names = self.header["ch_names"]
+        self.n_samples = self.header["n_samples"]
+        self.l_freq = l_freq
+        self.h_freq = h_freq
+        self.fir_design = fir_design
+        self.chunk_seconds = chunk_seconds
+        self.method = method
+
+        # A full filter length on both sides of a chunk makes the filtered chunk identical to
+        # the same samples of the filtered full recording: interior chunk edges never reach the
+        # kept samples, and chunks that touch the recording edges get the same edge padding.
+        self.pad = len(filtering.design(self.sfreq, l_freq, h_freq, "fft", fir_design))
+
+    def read(self, picks, start: int, stop: int):
+        """
+        Reads samples [start, stop) of the picked channel indices, in volts.
+
+        MULTIPLEXED files interleave the channels, so every page holds all of them: the range
+        is mapped `READ_BLOCK` bytes at a time and each mapping is dropped before the next, so
+        the touched pages of unpicked channels never stay resident. The picked samples are
+        written straight into the output array.
+
+        :return: Array of shape (len(picks), stop - start), float64.
+        """
+        h = self.header
+        n_ch = len(self.ch_names)
+        itemsize = np.dtype(h["dtype"]).itemsize
+        cals = np.asarray(h["cals"])[picks][:, np.newaxis]
+        data = np.empty((len(picks), stop - start))
+
+        if h["orientation"] == "MULTIPLEXED":
+            rows = max(READ_BLOCK // (n_ch * itemsize), 1)
+            for block in range(start, stop, rows):
+                n = min(rows, stop - block)
+                mm = np.memmap(h["data_file"], dtype=h["dtype"], mode="r",
+                               offset=block * n_ch * itemsize, shape=(n, n_ch))
+                data[:, block - start:block - start + n] = mm[:, picks].T
+                del mm
+        else:
+            for i, ch in enumerate(picks):
+                mm = np.memmap(h["data_file"], dtype=h["dtype"], mode="r",
+                               offset=(ch * self.n_samples + start) * itemsize, shape=(stop - start,))
+                data[i] = mm
+                del mm
+        data *= cals
+        return data
+
+    def read_filtered(self, picks, start: int, stop: int):
+        """
+        Reads and band-pass filters samples [start, stop) of the picked channel indices.
+        """
+        pad_start = max(start - self.pad, 0)
+        pad_stop = min(stop + self.pad, self.n_samples)
+        with profiling.stage("read") as stage:
+            data = self.read(picks, pad_start, pad_stop)
+            stage.add_bytes(data.size * np.dtype(self.header["dtype"]).itemsize)
+        with profiling.stage("filter", nbytes=data.nbytes):
+            data = filtering.filter_data(data, self.sfreq, self.l_freq, self.h_freq,
+                                         method=self.method, fir_design=self.fir_design, copy=False)
+        return data[:, start - pad_start:stop - pad_start]
+
+    def get_epochs(self, channels, events, tmin=-0.2, tmax=0.8, baseline=(None, 0),
+                   first_samp=0, bad_segments=(), window=None):
+        """
+        Builds baseline corrected epochs of the filtered data, like `mne.Epochs(...).get_data()`.
+
+        Parameters:
+            channels (list[str]): Channel names to pick.
+            events (np.ndarray): Events array (sample, previous, id).
+            tmin, tmax (float): Epoch limits in seconds relative to the events.
+            baseline (tuple): Baseline interval, `None` meaning the epoch start/end.
+            first_samp (int): First sample of the recording, subtracted from event samples.
+            bad_segments (iterable): (start, stop) sample ranges; overlapping epochs are dropped,
+                                     like `reject_by_annotation` does for BAD annotations.
+            window (tuple, optional): (start, end) in seconds. If given, every epoch is reduced
+                                      to its mean over this window (same sample indices as
+                                      `find_amp_diff_2`) as soon as its chunk is filtered, so
+                                      the epochs are never held in memory.
+
+        Returns:
+            tuple: (data, events, times) with data of shape (epochs, channels, samples), or
+                   (epochs, channels) with `window`. Epochs that fall outside the recording
+                   are dropped, like MNE does.
+        """
+        picks = [self.ch_names.index(ch) for ch in channels]
+        first = int(round(tmin * self.sfreq))
+        last = int(round(tmax * self.sfreq))
+        times = np.arange(first, last + 1) / self.sfreq
+
+        onsets = events[:, 0] - first_samp
+        starts = onsets + first
+        stops = onsets + last + 1
+        keep = (starts >= 0) & (stops <= self.n_samples)
+        for bad_start, bad_stop in bad_segments:
+            keep &= (stops <= bad_start) | (starts >= bad_stop)
+        events, starts = events[keep], starts[keep]
+
+        if baseline is not None:
+            b_min = times[0] if baseline[0] is None else baseline[0]
+            b_max = times[-1] if baseline[1] is None else baseline[1]
+            mask = (times >= b_min - 0.5 / self.sfreq) & (times <= b_max + 0.5 / self.sfreq)
+        if window is not None:
+            window = slice(int((window[0] - times[0]) * self.sfreq), int((window[1] - times[0]) * self.sfreq) + 1)
+            data = np.empty((len(events), len(picks)))
+        else:
+            data = np.empty((len(events), len(picks), len(times)))
+
+        max_span = max(int(self.chunk_seconds * self.sfreq), len(times))
+        i = 0
+        while i < len(starts):
+            # Group consecutive epochs whose span fits in one chunk
+            j = i + 1
+            while j < len(starts) and starts[j] + len(times) - starts[i] <= max_span:
+                j += 1
+            chunk_start, chunk_stop = starts[i], starts[j - 1] + len(times)
+            chunk = self.read_filtered(picks, chunk_start, chunk_stop)
+            for k in range(i, j):
+                offset = starts[k] - chunk_start
+                epoch = chunk[:, offset:offset + len(times)]
+                if window is None:
+                    data[k] = epoch
+                    continue
+                data[k] = epoch[:, window].mean(axis=1)
+                if baseline is not None:
+                    data[k] -= epoch[:, mask].mean(axis=1)
+            i = j
+
+        if baseline is not None and window is None:
+            data -= data[:, :, mask].mean(axis=2, keepdims=True)
+
+        return data, events, times
@@ -0,0 +1,132 @@
+import numpy as np
+import pandas as pd
+from Subjects import Participant
+
+# DataFrame column -> Participant attribute, in the order the analysis scripts export them
+COLUMNS = {
+    "Gender": "gender",
+    "Age": "age",
+    "Highest_Edu": "highest_edu",
+    "Highest_Adult_Edu": "highest_adult_edu",
+    "Income_Household": "income_household",
+    "amp_diff": "amp_diff",
+}
+
+
+class ParticipantTable:
+    def __init__(self, capacity=64):
+        """
+        Columnar, array-backed store of per-participant results.
+
+        Every column is a NumPy array (float64 for numbers, object for text) that grows by
+        doubling, so appending is amortized O(1) and any number of feature columns can be
+        added, e.g. one per channel or time window. Converting to pandas or Arrow hands the
+        arrays over as whole columns, without any per-row Python work.
+
+        :param capacity: Initial number of rows allocated.
+        """
+        self._columns = {}
+        self._capacity = capacity
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def columns(self):
+        return list(self._columns)
+
+    def __getitem__(self, name: str):
+        """
+        Returns a column as an array view of the filled rows.
+        """
+        return self._columns[name][:self._size]
+
+    def _column(self, name, numeric: bool):
+        # Returns the column to write `name` to, creating it or turning it to object if needed
+        column = self._columns.get(name)
+        if column is None:
+            column = np.full(self._capacity, np.nan) if numeric else np.full(self._capacity, None, dtype=object)
+        elif column.dtype != object and not numeric:
+            column = column.astype(object)  # A text value in a numeric column
+        self._columns[name] = column
+        return column
+
+    def _reserve(self, n_rows):
+        if n_rows <= self._capacity:
+            return
+        capacity = max(n_rows, 2 * self._capacity)
+        for name, column in self._columns.items():
+            grown = np.full(capacity, np.nan if column.dtype != object else None, dtype=column.dtype)
+            grown[:self._size] = column[:self._size]
+            self._columns[name] = grown
+        self._capacity = capacity
+
+    def append(self, **values):
+        """
+        Appends one row. Unknown names add new columns; columns missing from `values`
+        get NaN (numbers) or None (text).
+        """
+        self._reserve(self._size + 1)
+        for name, value in values.items():
+            numeric = isinstance(value, (int, float, np.number)) and not isinstance(value, (bool, np.bool_))
+            self._column(name, numeric)[self._size] = value
+        self._size += 1
+
+    def append_participant(self, participant, **features):
+        """
+        Appends a `Participant` and optional extra feature values of the same row.
+        """
+        self.append(**{attr: getattr(participant, attr) for attr in Participant.__slots__}, **features)
+
+    def extend(self, **columns):
+        """
+        Appends many rows at once from equally long arrays, one per column.
+        """
+        lengths = {len(values) for values in columns.values()}
+        if len(lengths) > 1:
+            raise ValueError(f"Columns have different lengths: {sorted(lengths)}")
+        n = lengths.pop() if lengths else 0
+        self._reserve(self._size + n)
+        for name, values in columns.items():
+            values = np.asarray(values)
+            self._column(name, values.dtype.kind in "iuf")[self._size:self._size + n] = values
+        self._size += n
+
+    def participants(self):
+        """
+        Rebuilds the `Participant` objects of the rows, e.g. for code that expects a list.
+        """
+        attrs = [self[attr] for attr in Participant.__slots__]
+        return [Participant(*row) for row in zip(*attrs)]
+
+    @classmethod
+    def from_participants(cls, participants, **features):
+        """
+        Builds a table from `Participant` objects, plus optional feature columns
+        (arrays with one value per participant).
+        """
+        table = cls(capacity=max(len(participants), 1))
+        table.extend(**{attr: [getattr(p, attr) for p in participants] for attr in Participant.__slots__},
+                     **features)
+        return table
+
+    def to_dataframe(self, export_names=False):
+        """
+        Returns the table as a DataFrame built column by column.
+
+        :param export_names: If True, the participant columns are named like in the analysis
+                             scripts' Excel output ("Gender", "Age", ..., "amp_diff").
+        """
+        df = pd.DataFrame({name: self[name] for name in self._columns}, copy=False)
+        if export_names:
+            df = df.rename(columns={attr: col for col, attr in COLUMNS.items()})
+        return df
+
+    def to_arrow(self):
+        """
+        Returns the table as a `pyarrow.Table` (requires the optional pyarrow package).
+        """
+        import pyarrow as pa
+
+        return pa.table({name: self[name] for name in self._columns})
@@ -0,0 +1,202 @@
+import os
+import time
+import numpy as np
+import mne
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from brainvision import read_vhdr
+from Subjects import EegRecordSubject
+import profiling
+import filtering
+
+# Size of the single read calls a recording is loaded with
+READ_BLOCK = 16 * 1024 * 1024
+
+
+class PrefetchedRecording:
+    def __init__(self, file_path: str, raw, header, buffer, read_s: float):
+        """
+        A BrainVision recording whose .eeg file has been read into memory, not decoded yet.
+
+        :param raw: The recording opened with `preload=False` (header, markers, annotations).
+        :param header: `brainvision.read_vhdr` of the recording.
+        :param buffer: The raw bytes of the .eeg file.
+        :param read_s: Time spent reading the files, in seconds.
+        """
+        self.file_path = file_path
+        self.raw = raw
+        self.header = header
+        self.buffer = buffer
+        self.read_s = read_s
+
+    @property
+    def nbytes(self):
+        return len(self.buffer)
+
+    def get_data(self, picks=None):
+        """
+        Decodes the samples of the picked channel indices to volts, like `Raw.get_data`.
+
+        :return: Array of shape (channels, samples), float64.
+        """
+        h = self.header
+        n_ch = len(h["ch_names"])
+        picks = np.arange(n_ch) if picks is None else np.asarray(picks)
+        samples = np.frombuffer(self.buffer, dtype=h["dtype"], count=h["n_samples"] * n_ch)
+        if h["orientation"] == "MULTIPLEXED":
+            samples = samples.reshape(h["n_samples"], n_ch)[:, picks].T
+        else:
+            samples = samples.reshape(n_ch, h["n_samples"])[picks]
+        return samples * np.asarray(h["cals"])[picks][:, np.newaxis]
+
+    def to_record(self, channels=None, filter_method="mne"):
+        """
+        Builds the filtered `EegRecordSubject`, as `EegRecordSubject(file_path, channels=channels)`
+        would from the files, without touching the disk.
+
+        The buffer is released once decoded.
+        """
+        ch_names = self.header["ch_names"] if channels is None else list(channels)
+        with profiling.stage("decode") as stage:
+            picks = [self.header["ch_names"].index(ch) for ch in ch_names]
+            data = self.get_data(picks)
+            stage.add_bytes(self.nbytes)
+            self.buffer = b""
+            raw = mne.io.RawArray(data, self.raw.copy().pick(ch_names).info,
+                                  first_samp=self.raw.first_samp, copy="auto", verbose=False)
+            raw.set_annotations(self.raw.annotations)
+        with profiling.stage("filter", nbytes=data.nbytes):
+            filtering.filter_raw(raw, method=filter_method, **EegRecordSubject.FILTER)
+        return EegRecordSubject.from_raw(raw, self.file_path)
+
+
+def read_recording(file_path: str):
+    """
+    Reads the header, markers and .eeg bytes of a recording. Runs in the loader threads.
+
+    :return: A `PrefetchedRecording`.
+    """
+    start = time.perf_counter()
+    header = read_vhdr(file_path)
+    raw = mne.io.read_raw_brainvision(file_path, preload=False, verbose=False)
+    size = os.path.getsize(header["data_file"])
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    with open(header["data_file"], "rb", buffering=0) as f:
+        done = 0
+        while done < size:
+            n = f.readinto(view[done:done + READ_BLOCK])
+            if not n:
+                raise EOFError(f"{header['data_file']} ended after {done} of {size} bytes")
+            done += n
+    return PrefetchedRecording(file_path, raw, header, buffer, time.perf_counter() - start)
+
+
+class PrefetchLoader:
+    def __init__(self, file_paths, depth=2, max_bytes=None, n_threads=1):
+        """
+        Reads the next recordings of a list in background threads while the current one is
+        processed.
+
+        Iterating yields `(file_path, recording, error)` in the order of `file_paths`, with
+        `recording` a `PrefetchedRecording` (or None and `error` the exception if reading
+        failed). File reads release the GIL, so they overlap with filtering and epoching.
+
+        :param file_paths: .vhdr paths, in processing order.
+        :param depth: Number of recordings read ahead of the one being processed.
+        :param max_bytes: Cap on the .eeg bytes held by read-ahead recordings (read or being
+                          read, not yet handed out). The next recording is always read when
+                          nothing else is buffered, even if it is larger than the cap.
+        :param n_threads: Reader threads. One is enough for a local disk; more help on
+                          network storage with high latency.
+        """
+        if depth < 1:
+            raise ValueError("depth must be at least 1")
+        self.file_paths = list(file_paths)
+        self.depth = depth
+        self.max_bytes = max_bytes
+        self.n_threads = n_threads
+
+        self.read_s = 0.0  # Time spent reading, summed over the threads
+        self.wait_s = 0.0  # Time the consumer was blocked on a read
+        self.elapsed_s = 0.0
+        self.nbytes = 0
+        self.peak_bytes = 0
+        self.n_read = 0
+
+    @staticmethod
+    def _size(file_path: str):
+        try:
+            return os.path.getsize(read_vhdr(file_path)["data_file"])
+        except Exception:
+            return 0  # The read itself reports the error
+
+    def __iter__(self):
+        start = time.perf_counter()
+        pending = deque()
+        buffered = 0
+        queue = deque(self.file_paths)
+        with ThreadPoolExecutor(max_workers=self.n_threads, thread_name_prefix="prefetch") as pool:
+            try:
+                while queue or pending:
+                    # Top up the read-ahead within the depth and memory caps
+                    while queue and len(pending) < self.depth + 1:
+                        size = self._size(queue[0])
+                        if pending and self.max_bytes is not None and buffered + size > self.max_bytes:
+                            break
+                        file_path = queue.popleft()
+                        pending.append((file_path, size, pool.submit(read_recording, file_path)))
+                        buffered += size
+                        self.peak_bytes = max(self.peak_bytes, buffered)
+
+                    file_path, size, future = pending.popleft()
+                    wait_start = time.perf_counter()
+                    try:
+                        recording, error = future.result(), None
+                    except Exception as e:
+                        recording, error = None, e
+                    self.wait_s += time.perf_counter() - wait_start
+                    buffered -= size
+                    if recording is not None:
+                        self.read_s += recording.read_s
+                        self.nbytes += recording.nbytes
+                        self.n_read += 1
+                    yield file_path, recording, error
+                    recording = None
+            finally:
+                for _, _, future in pending:
+                    future.cancel()
+                self.elapsed_s += time.perf_counter() - start
+
+    @property
+    def overlap(self):
+        """
+        Fraction of the read time hidden behind processing (1: reads never blocked, 0: no overlap).
+        """
+        if self.read_s <= 0:
+            return 0.0
+        return min(max(1 - self.wait_s / self.read_s, 0.0), 1.0)
+
+    def report(self):
+        """
+        :return: Dict with `recordings`, `bytes`, `read_s`, `wait_s`, `hidden_s` (read time that
+                 overlapped with processing), `overlap`, `peak_buffer_mb`, `elapsed_s` and
+                 `read_mb_s` (read throughput).
+        """
+        return {
+            "recordings": self.n_read,
+            "bytes": self.nbytes,
+            "read_s": self.read_s,
+            "wait_s": self.wait_s,
+            "hidden_s": max(self.read_s - self.wait_s, 0.0),
+            "overlap": self.overlap,
+            "peak_buffer_mb": self.peak_bytes / 2 ** 20,
+            "elapsed_s": self.elapsed_s,
+            "read_mb_s": self.nbytes / 2 ** 20 / self.read_s if self.read_s > 0 else 0.0,
+        }
+
+    def summary(self):
+        r = self.report()
+        return (f"Prefetch: {r['recordings']} recordings, {r['bytes'] / 2 ** 20:.0f} MB read in "
+                f"{r['read_s']:.2f} s, waited {r['wait_s']:.2f} s, {100 * r['overlap']:.0f}% of the "
+                f"reads overlapped with processing (peak buffer {r['peak_buffer_mb']:.0f} MB)")
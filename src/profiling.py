@@ -0,0 +1,214 @@
+import sys
+import json
+import time
+import tracemalloc
+import numpy as np
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Active profiler, None when profiling is off
+_profiler = None
+
+
+class _NullStage:
+    # Shared no-op stage returned while profiling is off, so instrumented code pays one call
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def add_bytes(self, nbytes):
+        pass
+
+
+_NULL_STAGE = _NullStage()
+
+
+def _max_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 ** 2 if sys.platform == "darwin" else peak / 1024  # bytes on macOS, KiB on Linux
+
+
+class _Stage:
+    def __init__(self, profiler, record, name, nbytes):
+        self.profiler = profiler
+        self.record = record
+        self.name = name
+        self.nbytes = nbytes
+        self.inner = 0.0
+
+    def __enter__(self):
+        self.profiler._stack.append(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        self.profiler._stack.pop()
+        if self.profiler._stack:
+            self.profiler._stack[-1].inner += elapsed
+        # Nested stages are not counted twice: a stage gets its time minus its inner stages
+        stages, nbytes = self.record["stages"], self.record["bytes"]
+        stages[self.name] = stages.get(self.name, 0.0) + elapsed - self.inner
+        if self.nbytes:
+            nbytes[self.name] = nbytes.get(self.name, 0) + int(self.nbytes)
+        return False
+
+    def add_bytes(self, nbytes):
+        self.nbytes += nbytes
+
+
+class _Subject:
+    def __init__(self, profiler, label):
+        self.profiler = profiler
+        self.record = {"subject": label, "total_s": 0.0, "stages": {}, "bytes": {},
+                       "peak_mem_mb": None, "error": None}
+
+    def __enter__(self):
+        self.outer = self.profiler._current
+        self.profiler._current = self.record
+        if self.profiler.trace_memory:
+            tracemalloc.reset_peak()
+        self.start = time.perf_counter()
+        return self.record
+
+    def __exit__(self, exc_type, exc, tb):
+        self.record["total_s"] = time.perf_counter() - self.start
+        self.record["unstaged_s"] = self.record["total_s"] - sum(self.record["stages"].values())
+        if self.profiler.trace_memory:
+            self.record["peak_mem_mb"] = tracemalloc.get_traced_memory()[1] / 1024 ** 2
+        else:
+            self.record["peak_mem_mb"] = _max_rss_mb()  # Process high-water mark
+        if exc is not None:
+            self.record["error"] = f"{type(exc).__name__}: {exc}"
+        self.profiler._current = self.outer
+        self.profiler.records.append(self.record)
+        return False
+
+
+class Profiler:
+    def __init__(self, trace_memory=False):
+        """
+        Collects per-subject stage timings, byte counts and peak memory.
+
+        Create it with `enable()`; instrumented code reports to it through `stage()` and
+        `subject()`, which do nothing while no profiler is enabled.
+
+        :param trace_memory: If True, peak memory per subject is measured with tracemalloc
+                             (NumPy buffers included), at some cost. Otherwise the process
+                             peak RSS at the end of each subject is recorded.
+        """
+        self.trace_memory = trace_memory
+        self.records = []
+        self._current = None
+        self._stack = []
+        # Stages run outside of any subject are collected here
+        self._other = {"subject": None, "total_s": 0.0, "stages": {}, "bytes": {},
+                       "peak_mem_mb": None, "error": None}
+
+    def stage(self, name: str, nbytes=0):
+        return _Stage(self, self._current if self._current is not None else self._other, name, nbytes)
+
+    def subject(self, label):
+        return _Subject(self, label)
+
+    def add(self, records):
+        """
+        Merges records collected in another process (e.g. a cohort worker).
+        """
+        self.records.extend(records)
+
+    def report(self, top=10, bins=10):
+        """
+        Builds a machine-readable report of the run.
+
+        Returns:
+            dict: With the keys
+                - `subjects`: every subject record (total time, time and bytes per stage, peak memory).
+                - `slowest`: the `top` slowest subjects.
+                - `stages`: per stage total/mean/max time, share of the run time, bytes, and a
+                  histogram of the per-subject times (`edges`, `counts`).
+                - `other`: stages that ran outside of any subject.
+        """
+        records = list(self.records)
+        total = sum(r["total_s"] for r in records)
+        names = sorted({name for r in records for name in r["stages"]})
+
+        stages = {}
+        for name in names:
+            times = np.array([r["stages"].get(name, 0.0) for r in records])
+            counts, edges = np.histogram(times, bins=bins)
+            stages[name] = {
+                "total_s": float(times.sum()),
+                "mean_s": float(times.mean()),
+                "max_s": float(times.max()),
+                "share": float(times.sum() / total) if total else 0.0,
+                "bytes": int(sum(r["bytes"].get(name, 0) for r in records)),
+                "histogram": {"edges": edges.tolist(), "counts": counts.tolist()},
+            }
+
+        return {
+            "n_subjects": len(records),
+            "total_s": total,
+            "subjects": records,
+            "slowest": sorted(records, key=lambda r: r["total_s"], reverse=True)[:top],
+            "stages": stages,
+            "other": self._other,
+        }
+
+    def save(self, path: str, **kwargs):
+        with open(path, "w") as f:
+            json.dump(self.report(**kwargs), f, indent=2, default=str)
+
+
+def enable(trace_memory=False):
+    """
+    Turns profiling on and returns the new active `Profiler`.
+    """
+    global _profiler
+    if trace_memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    _profiler = Profiler(trace_memory)
+    return _profiler
+
+
+def disable():
+    """
+    Turns profiling off and returns the profiler that was active, if any.
+    """
+    global _profiler
+    profiler, _profiler = _profiler, None
+    if profiler is not None and profiler.trace_memory:
+        tracemalloc.stop()
+    return profiler
+
+
+def active():
+    return _profiler
+
+
+def stage(name: str, nbytes=0):
+    """
+    Context manager timing one pipeline stage (e.g. "read", "filter", "epoch").
+
+    :param nbytes: Bytes processed by the stage, if known upfront. More can be added
+                   with the `add_bytes` method of the returned object.
+    """
+    if _profiler is None:
+        return _NULL_STAGE
+    return _profiler.stage(name, nbytes)
+
+
+def subject(label):
+    """
+    Context manager grouping the stages run inside it under one subject.
+    """
+    if _profiler is None:
+        return _NULL_STAGE
+    return _profiler.subject(label)
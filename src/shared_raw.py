@@ -0,0 +1,250 @@
+import os
+import sys
+import shutil
+import tempfile
+import numpy as np
+import mne
+from multiprocessing import shared_memory
+from Subjects import EegRecordSubject
+from brainvision import read_vhdr
+
+# Backing of the segments. On POSIX systems a named shared memory block (/dev/shm on Linux)
+# lives until it is unlinked. On Windows it is freed as soon as its last handle is closed, so
+# a segment could vanish between two processes; there, segments are files in a temporary
+# folder, memory-mapped by every process (served from the OS page cache).
+USE_SHARED_MEMORY = os.name == "posix"
+
+
+class SharedRawHandle:
+    def __init__(self, name: str, shape, dtype: str, info=None, first_samp=0, annotations=None,
+                 file_path=None, events=None, event_id=None):
+        """
+        Picklable description of a segment holding a filtered recording.
+
+        It holds everything needed to rebuild the `EegRecordSubject` in another process except
+        the samples themselves, which stay in the segment `name` (a shared memory block name,
+        or a file path when `USE_SHARED_MEMORY` is False). A handle returned by
+        `SharedRawStore.create` only describes the empty segment; `publish` returns the
+        complete one.
+        """
+        self.name = name
+        self.shape = tuple(shape)
+        self.dtype = dtype
+        self.info = info
+        self.first_samp = first_samp
+        self.annotations = annotations
+        self.file_path = file_path
+        self.events = events
+        self.event_id = event_id
+
+    @property
+    def nbytes(self):
+        return int(np.prod(self.shape)) * np.dtype(self.dtype).itemsize
+
+    def __repr__(self):
+        return f"SharedRawHandle(name={self.name}, shape={self.shape}, file_path={self.file_path})"
+
+
+def _open_segment(name: str):
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    # Older versions register every opened block with the resource tracker, which the workers
+    # share with the owner. Registering is idempotent and the workers never unregister, so the
+    # single unregister of `SharedRawStore.discard` (in `unlink`) balances them all.
+    return shared_memory.SharedMemory(name=name)
+
+
+def _open_array(handle: SharedRawHandle, writable: bool):
+    """
+    Maps a segment in this process. Returns (array, shared memory object or None).
+    """
+    if USE_SHARED_MEMORY:
+        shm = _open_segment(handle.name)
+        return np.ndarray(handle.shape, dtype=handle.dtype, buffer=shm.buf), shm
+    # Copy-on-write for readers: the segment itself is never modified by a query
+    return np.memmap(handle.name, dtype=handle.dtype, mode="r+" if writable else "c", shape=handle.shape), None
+
+
+def expected_shape(vhdr_path: str):
+    """
+    Shape of the filtered data of a recording, (channels, samples), from its header only.
+    """
+    header = read_vhdr(vhdr_path)
+    return len(header["ch_names"]), header["n_samples"]
+
+
+def publish(record: EegRecordSubject, segment: SharedRawHandle):
+    """
+    Copies the filtered data of a loaded record into a segment created by `SharedRawStore.create`.
+
+    The calling process (a worker) only writes into the segment; it never owns it, so the
+    segment outlives the worker whatever the platform.
+
+    :return: The complete `SharedRawHandle`, to pass to `SharedRawStore.adopt` in the owner.
+    """
+    data = record.raw.get_data()
+    if data.shape != segment.shape or data.dtype != np.dtype(segment.dtype):
+        raise ValueError(f"Recording {record.file_path} has shape {data.shape} ({data.dtype}), "
+                         f"the segment expects {segment.shape} ({segment.dtype})")
+    array, shm = _open_array(segment, writable=True)
+    array[:] = data
+    del data
+    if shm is None:
+        array.flush()
+    del array
+    if shm is not None:
+        shm.close()
+    return SharedRawHandle(segment.name, segment.shape, segment.dtype, record.raw.info, record.raw.first_samp,
+                           record.raw.annotations, record.file_path, record.events, record.event_id)
+
+
+class SharedRecord:
+    def __init__(self, handle: SharedRawHandle):
+        """
+        Zero-copy view of a published recording, usable as a context manager.
+
+        `record` is an `EegRecordSubject` whose `raw` data is the segment itself, so
+        `find_amp_diff_2` and `epoch_once` run without loading or filtering.
+        The data must be treated as read-only.
+        """
+        self.handle = handle
+        data, self._shm = _open_array(handle, writable=False)
+        raw = mne.io.RawArray(data, handle.info, first_samp=handle.first_samp, copy="auto", verbose=False)
+        raw.set_annotations(handle.annotations)
+        self.record = EegRecordSubject.from_raw(raw, handle.file_path, handle.events, handle.event_id)
+
+    def close(self):
+        """
+        Drops this process' mapping of the segment (the segment itself stays).
+        """
+        self.record = None
+        if self._shm is None:
+            return  # The memory map is released with the last array pointing into it
+        try:
+            self._shm.close()
+        except BufferError:
+            pass  # Arrays still point into the mapping; it is unmapped when they are freed
+
+    def __enter__(self):
+        return self.record
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+def attach(handle: SharedRawHandle):
+    """
+    Returns a `SharedRecord` over a published recording; close it when done.
+    """
+    return SharedRecord(handle)
+
+
+class SharedRawStore:
+    def __init__(self):
+        """
+        Owner of the segments, with reference counted lifetimes.
+
+        Segments are created here, in the process that runs the schedule, and stay open until
+        released: workers only write into them (`publish`) or map them (`attach`). This keeps
+        them alive on Windows, where a named block dies with its last open handle.
+
+        Each published segment gets the number of consumers that will use it (`adopt`). Every
+        `release` drops one reference and the segment is freed when the last one is gone, so
+        memory is returned as soon as all queries of a recording are done. `close` (or leaving
+        the `with` block) frees whatever is left, e.g. after a failure. If the process is killed
+        before that, its segments stay in the temporary folder (Windows) or in /dev/shm on
+        Python 3.13+, where they are not tracked; before 3.13 the resource tracker removes them.
+        """
+        self.refs = {}
+        self.handles = {}
+        self._segments = {}  # name -> open SharedMemory (POSIX) or None (file)
+        self._dir = None if USE_SHARED_MEMORY else tempfile.mkdtemp(prefix="shared_raw_")
+
+    def create(self, shape, dtype="float64"):
+        """
+        Creates an empty segment, owned by this store until it is released or discarded.
+
+        :return: A `SharedRawHandle` describing the segment, to pass to `publish`.
+        """
+        nbytes = max(int(np.prod(shape)) * np.dtype(dtype).itemsize, 1)
+        if USE_SHARED_MEMORY:
+            if sys.version_info >= (3, 13):
+                shm = shared_memory.SharedMemory(create=True, size=nbytes, track=False)
+            else:
+                shm = shared_memory.SharedMemory(create=True, size=nbytes)
+            name = shm.name
+        else:
+            shm = None
+            fd, name = tempfile.mkstemp(suffix=".dat", dir=self._dir)
+            with os.fdopen(fd, "wb") as f:
+                f.truncate(nbytes)
+        self._segments[name] = shm
+        self.refs[name] = 0
+        handle = SharedRawHandle(name, shape, np.dtype(dtype).str)
+        self.handles[name] = handle
+        return handle
+
+    def adopt(self, handle: SharedRawHandle, refs: int):
+        """
+        Records the published content of a segment and the number of consumers that will use it.
+        """
+        if refs <= 0:
+            self.discard(handle.name)
+            return
+        self.handles[handle.name] = handle
+        self.refs[handle.name] = refs
+
+    def acquire(self, name: str, n=1):
+        """
+        Adds consumers to a segment that is still alive.
+        """
+        self.refs[name] += n
+
+    def release(self, name: str):
+        """
+        Drops one reference; frees the segment when it was the last one.
+
+        :return: True if the segment was freed.
+        """
+        self.refs[name] -= 1
+        if self.refs[name] > 0:
+            return False
+        self.discard(name)
+        return True
+
+    def discard(self, name: str):
+        """
+        Frees a segment right away, e.g. when publishing into it failed.
+        """
+        self.refs.pop(name, None)
+        self.handles.pop(name, None)
+        shm = self._segments.pop(name, None)
+        if shm is not None:
+            shm.close()
+            shm.unlink()
+        elif not USE_SHARED_MEMORY:
+            try:
+                os.remove(name)
+            except OSError:
+                pass  # Still mapped by a worker on Windows; removed with the folder in `close`
+
+    @property
+    def nbytes(self):
+        """
+        Total size of the live segments.
+        """
+        return sum(handle.nbytes for handle in self.handles.values())
+
+    def close(self):
+        for name in list(self._segments):
+            self.discard(name)
+        if self._dir is not None:
+            shutil.rmtree(self._dir, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
@@ -0,0 +1,274 @@
+import os
+import re
+import time
+import heapq
+import numpy as np
+from scipy import signal
+from brainvision import read_vhdr, _codepage, _decode, _parse_marker, event_code, IGNORED_MARKERS
+
+
+class OddballMonitor:
+    def __init__(self, sfreq: float, ch_names, channels, rare_events, tmin: float, tmax: float,
+                 l_freq=0.1, h_freq=40, order=4, epoch_tmin=-0.2, epoch_tmax=0.8, max_delay=2.0):
+        """
+        Live rare-vs-frequent amplitude difference of a recording that is still being acquired.
+
+        Sample chunks are pushed as they arrive. The picked channels are band-pass filtered
+        causally, chunk by chunk, and every event is epoched (with baseline correction) as soon
+        as the last sample of its epoch has been received. Each epoch is reduced to its mean
+        amplitude over `channels` and the [tmin, tmax] window, and added to running sums, so
+        `amp_diff` is updated in O(1) per event and equals the `find_amp_diff_2` formula over
+        the epochs seen so far.
+
+        Only the samples an epoch can still need are kept, so memory does not grow with the
+        length of the session, and an event is processed at most one chunk after its epoch
+        closes.
+
+        :param sfreq: Sampling rate in Hz.
+        :param ch_names: Channel names of the pushed chunks, in row order.
+        :param channels: Channels to analyze; only these are filtered and buffered.
+        :param rare_events: Event IDs that are considered "rare" events; all others are frequent.
+        :param tmin, tmax: Amplitude window in seconds relative to the event.
+        :param l_freq, h_freq: Band-pass edges in Hz.
+        :param order: Order of the Butterworth band-pass (second-order sections).
+        :param epoch_tmin, epoch_tmax: Epoch limits, the baseline is [epoch_tmin, 0].
+        :param max_delay: Seconds of filtered history kept for events whose marker arrives
+                          after their samples. Older events are dropped and counted in `n_dropped`.
+
+        Notes:
+            - The causal IIR filter is not the zero-phase FIR filter of `EegRecordSubject`: it
+              delays and slightly reshapes the ERP, so live values follow the offline ones
+              closely but not exactly. The offline analysis stays the reference.
+        """
+        self.sfreq = sfreq
+        self.channels = list(channels)
+        self.picks = [list(ch_names).index(ch) for ch in self.channels]
+        self.rare_events = np.asarray(rare_events)
+
+        self.first = int(round(epoch_tmin * sfreq))
+        self.last = int(round(epoch_tmax * sfreq))
+        times = np.arange(self.first, self.last + 1) / sfreq
+        self.baseline = times <= 0.5 / sfreq
+        # Same sample index convention as find_amp_diff_2
+        self.window = slice(int((tmin - times[0]) * sfreq), int((tmax - times[0]) * sfreq) + 1)
+        self.history = self.last - self.first + 1 + int(max_delay * sfreq)
+
+        self.sos = signal.butter(order, [l_freq, h_freq], btype="bandpass", fs=sfreq, output="sos")
+        self._zi = None
+        self._buffer = np.empty((len(self.picks), 0))
+        self._buffer_start = 0
+        self._pending = []
+
+        self.n_samples = 0
+        self.n_rare = 0
+        self.n_freq = 0
+        self.n_dropped = 0
+        self.sum_rare = 0.0
+        self.sum_freq = 0.0
+        self.max_latency = 0.0
+
+    @classmethod
+    def from_vhdr(cls, vhdr_path: str, channels, rare_events, tmin: float, tmax: float, **kwargs):
+        """
+        Creates a monitor for the recording described by a BrainVision header.
+        """
+        header = read_vhdr(vhdr_path)
+        return cls(header["sfreq"], header["ch_names"], channels, rare_events, tmin, tmax, **kwargs)
+
+    @property
+    def mean_rare(self):
+        return self.sum_rare / self.n_rare if self.n_rare else np.nan
+
+    @property
+    def mean_freq(self):
+        return self.sum_freq / self.n_freq if self.n_freq else np.nan
+
+    @property
+    def amp_diff(self):
+        return self.mean_rare - self.mean_freq
+
+    def push(self, data, events=()):
+        """
+        Adds a chunk of samples and the events received with it.
+
+        Parameters:
+            data (np.ndarray): Samples of shape (channels, n), in volts, following the
+                               previously pushed samples.
+            events (array-like): MNE style events (sample, 0, id), with samples counted from
+                                 the start of the recording. They may refer to samples that
+                                 have not been pushed yet.
+
+        Returns:
+            list[tuple]: (sample, event ID, epoch amplitude, is rare) of every event epoched
+                         during this call, in event order.
+        """
+        data = np.asarray(data)[self.picks].astype(np.float64)
+        if self._zi is None and data.shape[1]:
+            # Start the filter in steady state on the first sample to avoid a large onset transient
+            self._zi = signal.sosfilt_zi(self.sos)[:, np.newaxis, :] * data[np.newaxis, :, :1]
+        if data.shape[1]:
+            data, self._zi = signal.sosfilt(self.sos, data, axis=1, zi=self._zi)
+        self._buffer = np.concatenate([self._buffer, data], axis=1)
+        self.n_samples += data.shape[1]
+
+        for event in np.asarray(events, dtype=int).reshape(-1, 3):
+            heapq.heappush(self._pending, (int(event[0]), int(event[2])))
+
+        results = []
+        while self._pending and self._pending[0][0] + self.last + 1 <= self.n_samples:
+            sample, event_id = heapq.heappop(self._pending)
+            start = sample + self.first
+            if start < self._buffer_start:
+                self.n_dropped += 1  # Epoch starts before the recording or the kept history
+                continue
+            epoch = self._buffer[:, start - self._buffer_start:start - self._buffer_start + self.last - self.first + 1]
+            epoch = epoch - epoch[:, self.baseline].mean(axis=1, keepdims=True)
+            value = float(epoch[:, self.window].mean())
+
+            rare = bool(np.isin(event_id, self.rare_events))
+            if rare:
+                self.n_rare += 1
+                self.sum_rare += value
+            else:
+                self.n_freq += 1
+                self.sum_freq += value
+            self.max_latency = max(self.max_latency, (self.n_samples - (sample + self.last + 1)) / self.sfreq)
+            results.append((sample, event_id, value, rare))
+
+        # Keep only the history that pending or late events can still need
+        keep_from = max(self.n_samples - self.history, 0)
+        if keep_from > self._buffer_start:
+            self._buffer = self._buffer[:, keep_from - self._buffer_start:]
+            self._buffer_start = keep_from
+        return results
+
+
+class ArraySource:
+    def __init__(self, data, events, chunk_size: int):
+        """
+        In-process stand-in for an acquisition: replays a recording in chunks.
+
+        :param data: Samples of shape (channels, n).
+        :param events: MNE style events (sample, 0, id).
+        :param chunk_size: Samples per chunk.
+
+        Iterating yields (chunk, events) pairs; each event is delivered with the chunk that
+        contains its sample.
+        """
+        self.data = data
+        self.events = np.asarray(events, dtype=int).reshape(-1, 3)
+        self.chunk_size = chunk_size
+
+    def __iter__(self):
+        for start in range(0, self.data.shape[1], self.chunk_size):
+            stop = start + self.chunk_size
+            in_chunk = (self.events[:, 0] >= start) & (self.events[:, 0] < stop)
+            yield self.data[:, start:stop], self.events[in_chunk]
+
+
+class BrainVisionFollower:
+    def __init__(self, vhdr_path: str, poll_interval=0.5, timeout=10.0, max_samples=None):
+        """
+        Follows a BrainVision recording while the acquisition software writes it.
+
+        The .eeg file is read from where the previous read stopped, in whole samples and at
+        most `max_samples` at a time, and only the complete lines appended to the .vmrk file
+        since the previous poll are parsed. Memory and the cost of a poll do not grow with the
+        length of the session, even when attaching late or catching up after a stall.
+
+        :param vhdr_path: Path to the .vhdr file. The header must already be complete.
+        :param poll_interval: Seconds to wait when no new samples are available.
+        :param timeout: The iteration ends after this many seconds without new samples.
+        :param max_samples: Most samples returned by one read. Default: 10 seconds of data.
+
+        Notes:
+            - Only MULTIPLEXED data can grow sample by sample, VECTORIZED files raise `ValueError`.
+            - Non standard marker descriptions get their codes in order of appearance, not in
+              sorted order like `read_events`, since later markers are not known yet.
+        """
+        self.header = read_vhdr(vhdr_path)
+        if self.header["orientation"] != "MULTIPLEXED":
+            raise ValueError("Only MULTIPLEXED recordings can be followed while recording")
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        self.cals = np.asarray(self.header["cals"])[:, np.newaxis]
+        self.frame = len(self.header["ch_names"]) * np.dtype(self.header["dtype"]).itemsize
+        self.max_samples = max_samples or int(10 * self.header["sfreq"])
+        self._offset = 0
+        self._marker_offset = 0
+        self._codepage = None
+        self._section = None
+        self._n_markers = 0
+        self._others = {}
+
+    def read_chunk(self):
+        """
+        Returns the samples written since the previous call (at most `max_samples`), of shape
+        (channels, n), in volts.
+        """
+        with open(self.header["data_file"], "rb") as f:
+            f.seek(self._offset)
+            raw = f.read(self.max_samples * self.frame)
+        raw = raw[:len(raw) - len(raw) % self.frame]  # A partly written sample is read next time
+        self._offset += len(raw)
+        data = np.frombuffer(raw, dtype=self.header["dtype"]).reshape(-1, len(self.cals)).T
+        return data * self.cals
+
+    def read_events(self):
+        """
+        Returns the markers added since the previous call as MNE style events.
+        """
+        if not self.header["marker_file"] or not os.path.exists(self.header["marker_file"]):
+            return np.zeros((0, 3), dtype=int)
+        with open(self.header["marker_file"], "rb") as f:
+            f.seek(self._marker_offset)
+            raw = f.read()
+        raw = raw[:raw.rfind(b"\n") + 1]  # A partly written line is read next time
+        self._marker_offset += len(raw)
+        if self._codepage is None:
+            self._codepage = _codepage(raw)  # Declared at the top of the file, in the first read
+
+        events = []
+        for line in _decode(raw, self._codepage).splitlines():
+            line = line.strip()
+            if line.startswith("[") and line.endswith("]"):
+                self._section = line[1:-1].lower()
+                continue
+            if self._section != "marker infos" or not re.match(r"Mk\d+=", line):
+                continue
+            onset, _, description = _parse_marker(line.split("=", 1)[1])
+            self._n_markers += 1
+            if self._n_markers == 1 and description.startswith("New Segment/"):
+                continue
+            if not IGNORED_MARKERS.match(description):
+                events.append([onset, 0, event_code(description, self._others)])
+        return np.array(events, dtype=int).reshape(-1, 3)
+
+    def __iter__(self):
+        idle_since = time.monotonic()
+        while True:
+            data = self.read_chunk()
+            events = self.read_events()
+            if data.shape[1] or len(events):
+                idle_since = time.monotonic()
+                yield data, events
+            elif time.monotonic() - idle_since > self.timeout:
+                return
+            else:
+                time.sleep(self.poll_interval)
+
+
+def monitor_stream(source, monitor: OddballMonitor, callback=None):
+    """
+    Feeds every chunk of `source` to `monitor`.
+
+    :param source: Iterable of (chunk, events) pairs, e.g. `BrainVisionFollower` or `ArraySource`.
+    :param callback: Called as `callback(monitor, results)` after every chunk that closed at
+                     least one epoch, e.g. to print or plot the running `amp_diff`.
+    :return: The monitor, with the final running means.
+    """
+    for data, events in source:
+        results = monitor.push(data, events)
+        if results and callback is not None:
+            callback(monitor, results)
+    return monitor
@@ -0,0 +1,36 @@
+import sys
+import os
+import tempfile
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(HERE), "src"))  # Add src/ to Python's module search path
+sys.path.insert(0, os.path.join(os.path.dirname(HERE), "benchmarks"))
+
+import mne
+import epoch_store as es
+from Subjects import EegRecordSubject
+import synthetic_dataset
+
+queries = [(["Pz", "P3", "P4"], [201, 202], 0.3, 0.6), (["Pz", "P3", "P4"], [201, 202], 0.25, 0.5),
+           (["Fz"], [201, 202], 0.125, 0.225), (["Cz"], [201, 202], 0.33, 0.41), (["P3"], [201, 202], 0.27, 0.31)]
+
+
+def test_decimation_error_within_bound():
+    """
+    The amp_diff error of the stored epochs stays within the bound documented in `EpochStore`,
+    for every query, at every rate, on a few synthetic recordings.
+    """
+    mne.set_log_level("ERROR")
+    with tempfile.TemporaryDirectory() as folder:
+        for seed in range(3):
+            vhdr = synthetic_dataset.write_recording(folder, f"sub-{seed + 1:03d}_task-visualoddball_eeg",
+                                                     n_channels=32, duration=60.0, sfreq=500.0, seed=seed)
+            record = EegRecordSubject(vhdr)
+            for sfreq in [250, 200, 125, 100]:
+                df = es.check_accuracy(record, queries, sfreq)
+                exceeded = df[df["abs_error"] > df["error_bound"]]
+                assert exceeded.empty, f"seed {seed}, {sfreq} Hz:\n{exceeded}"
+
+
+if __name__ == "__main__":
+    test_decimation_error_within_bound()
+    print("ok")
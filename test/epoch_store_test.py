@@ -0,0 +1,27 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath("C:\PyhtonDAP\src"))  # Add src/ to Python's module search path
+
+import epoch_store as es
+from Subjects import EegRecordSubject
+
+
+path = r"src\rodata"
+channels = ["Pz", "P3", "P4"]
+queries = [(channels, [201, 202], 0.3, 0.6), (channels, [201, 202], 0.25, 0.5), (["Fz"], [201, 202], 0.125, 0.225)]
+
+if __name__ == "__main__":
+    # Error of the decimated epochs relative to the full rate
+    record = EegRecordSubject(rf"{path}\sub-001\eeg\sub-001_task-visualoddball_eeg.vhdr")
+    for sfreq in [250, 125, 100]:
+        print(sfreq)
+        print(es.check_accuracy(record, queries, sfreq))
+
+    # Build once, then query the store without reading the recordings
+    store = es.EpochStore("epoch_store")
+    store.build(path, max_files=10, channels=channels + ["Fz"])
+    records = store.records()
+    print({i: r.amp_diff(*queries[0]) for i, r in records.items()})
+    print({i: es.peak_latency(r, channels, [201, 202], 0.25, 0.6) for i, r in records.items()})
+    times, mean, sem, n = es.grand_average(records, channels, [201, 202])
+    print(f"Grand average of {n} subjects: peak {mean.max()} at {times[mean.argmax()]} s")
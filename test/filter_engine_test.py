@@ -0,0 +1,20 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath("C:\PyhtonDAP\src"))  # Add src/ to Python's module search path
+
+import mne
+import filtering
+from Subjects import EegRecordSubject
+
+
+file_path = r"src\rodata\sub-001\eeg\sub-001_task-visualoddball_eeg.vhdr"
+channels = ["Pz", "P3", "P4"]
+
+# Difference of every engine to the current raw.filter output
+raw = mne.io.read_raw_brainvision(file_path, preload=True)
+print(filtering.check_accuracy(raw, 0.1, 40))
+
+# Effect on the analysis result
+for method in filtering.METHODS:
+    eeg_r = EegRecordSubject(file_path, filter_method=method, channels=channels)
+    print(method, eeg_r.find_amp_diff_2(channels, [201, 202], 0.3, 0.6))
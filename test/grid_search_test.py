@@ -0,0 +1,27 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath("C:\PyhtonDAP\src"))  # Add src/ to Python's module search path
+
+import time
+import grid_search as gs
+from checkpoint import GridCheckpoint
+
+
+path = r"src\rodata"
+channel_sets = [["Pz", "P3", "P4"], ["Fz", "F3", "F4"]]
+windows = [(0.3, 0.6), (0.125, 0.225)]
+
+if __name__ == "__main__":
+    checkpoint = GridCheckpoint("grid_results.sqlite")
+
+    start = time.perf_counter()
+    df = gs.grid_search(path, channel_sets, windows, [[201, 202]], checkpoint, max_files=10)
+    print(f"First run: {time.perf_counter() - start:.1f} s")
+
+    # Only the cells of the new window are computed
+    start = time.perf_counter()
+    df = gs.grid_search(path, channel_sets, windows + [(0.2, 0.5)], [[201, 202]], checkpoint, max_files=10)
+    print(f"Extended run: {time.perf_counter() - start:.1f} s")
+
+    checkpoint.close()
+    print(gs.summarize_grid(df))
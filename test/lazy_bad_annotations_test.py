@@ -0,0 +1,57 @@
+import sys
+import os
+import tempfile
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(HERE), "src"))  # Add src/ to Python's module search path
+sys.path.insert(0, os.path.join(os.path.dirname(HERE), "benchmarks"))
+
+import numpy as np
+import mne
+from Subjects import EegRecordSubject
+from brainvision import read_events
+import synthetic_dataset
+
+channels = ["Pz", "P3", "P4"]
+
+
+def write_recording_with_bad_intervals(folder):
+    """
+    Synthetic recording with two 100-sample "Bad Interval" markers: one ending exactly where
+    an epoch starts (the epoch must be kept), one overlapping the middle of another epoch.
+    """
+    vhdr = synthetic_dataset.write_recording(folder, "sub-001_task-visualoddball_eeg", n_channels=32,
+                                             duration=60.0, sfreq=500.0, seed=1)
+    events = read_events(vhdr)["events"]
+    first = int(round(-0.2 * 500))
+    touching = events[10, 0] + first - 100  # Ends at the first sample of epoch 10 (exclusive end)
+    overlapping = events[30, 0] + 50        # Inside epoch 30
+    with open(vhdr[:-5] + ".vmrk", "a", encoding="utf-8") as f:
+        for k, onset in enumerate([touching, overlapping]):
+            f.write(f"Mk{len(events) + 2 + k}=Bad Interval,Bad Min-Max,{onset + 1},100,0\n")
+    return vhdr
+
+
+def test_lazy_matches_eager_with_bad_annotations():
+    with tempfile.TemporaryDirectory() as folder:
+        vhdr = write_recording_with_bad_intervals(folder)
+        eager = EegRecordSubject(vhdr)
+        lazy = EegRecordSubject(vhdr, lazy=True)
+        assert len([a for a in eager.raw.annotations if a["description"].lower().startswith("bad")]) == 2
+
+        epochs = mne.Epochs(eager.raw, events=eager.events, event_id=eager.event_id, tmin=-0.2, tmax=0.8,
+                            picks=channels, baseline=(None, 0))
+        epochs.drop_bad()
+        data, events, _ = lazy._lazy_epochs(channels)
+        assert np.array_equal(events, epochs.events), (len(events), len(epochs.events))
+        assert eager.events[10, 0] in events[:, 0]  # Starts where a BAD interval ends: kept
+        assert eager.events[30, 0] not in events[:, 0]  # Overlaps a BAD interval: dropped
+        np.testing.assert_allclose(data, epochs.get_data(), rtol=0, atol=1e-12)
+
+        for window in [(0.3, 0.6), (0.125, 0.225)]:
+            expected = eager.find_amp_diff_2(channels, [201, 202], *window)
+            assert abs(lazy.find_amp_diff_2(channels, [201, 202], *window) - expected) < 1e-15
+
+
+if __name__ == "__main__":
+    test_lazy_matches_eager_with_bad_annotations()
+    print("ok")
@@ -0,0 +1,19 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath("C:\PyhtonDAP\src"))  # Add src/ to Python's module search path
+
+import amp_funcs as af
+import cohort_runner as cr
+
+
+path = r"src\rodata"
+
+if __name__ == "__main__":
+    serial = af.get_amp_diff_data(path, ["Pz", "P3", "P4"], [201, 202], 0.3, 0.6, max_files=10)
+    parallel = cr.get_amp_diff_data_parallel(path, ["Pz", "P3", "P4"], [201, 202], 0.3, 0.6,
+                                             max_files=10, n_workers=4)
+
+    print([p.amp_diff for p in serial] == [p.amp_diff for p in parallel])
+
+    for result in cr.iter_amp_diff_data(path, ["Pz", "P3", "P4"], [201, 202], 0.3, 0.6, max_files=10):
+        print(result)
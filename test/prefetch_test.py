@@ -0,0 +1,27 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath("C:\PyhtonDAP\src"))  # Add src/ to Python's module search path
+
+import time
+import amp_funcs as af
+from prefetch import PrefetchLoader
+
+
+path = r"src\rodata"
+channels = ["Pz", "P3", "P4"]
+
+if __name__ == "__main__":
+    # Same values with and without read-ahead; the prefetch run prints the achieved overlap
+    for prefetch in [0, 2]:
+        start = time.perf_counter()
+        participants = af.get_amp_diff_data(path, channels, [201, 202], 0.3, 0.6, max_files=10,
+                                            prefetch=prefetch, prefetch_bytes=2 ** 30)
+        print(f"prefetch={prefetch}: {time.perf_counter() - start:.1f} s")
+        print([p.amp_diff for p in participants])
+
+    # The loader alone, e.g. to check the read throughput of a network share
+    files = [rf"{path}\sub-{i:03}\eeg\sub-{i:03}_task-visualoddball_eeg.vhdr" for i in range(1, 11)]
+    loader = PrefetchLoader(files, depth=4, n_threads=4)
+    for file_path, recording, error in loader:
+        print(file_path, error if error else f"{recording.nbytes / 2 ** 20:.0f} MB")
+    print(loader.report())
@@ -0,0 +1,28 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath("C:\PyhtonDAP\src"))  # Add src/ to Python's module search path
+
+import amp_funcs as af
+import cohort_runner as cr
+import profiling
+
+
+path = r"src\rodata"
+
+if __name__ == "__main__":
+    profiler = profiling.enable(trace_memory=True)
+    af.get_amp_diff_data(path, ["Pz", "P3", "P4"], [201, 202], 0.3, 0.6, max_files=10)
+    profiling.disable()
+    profiler.save("profile_serial.json")
+
+    report = profiler.report(top=3)
+    for record in report["slowest"]:
+        print(record["subject"], record["total_s"], record["stages"])
+    for name, stage in report["stages"].items():
+        print(name, stage["total_s"], stage["share"], stage["bytes"])
+
+    profiler = profiling.enable()
+    cr.get_amp_diff_data_parallel(path, ["Pz", "P3", "P4"], [201, 202], 0.3, 0.6, max_files=10,
+                                  n_workers=4, lazy=True)
+    profiling.disable()
+    profiler.save("profile_parallel.json")
@@ -0,0 +1,40 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath("C:\PyhtonDAP\src"))  # Add src/ to Python's module search path
+
+import amp_funcs as af
+import cohort_runner as cr
+
+
+path = r"src\rodata"
+param_sets = [
+    (["Pz", "P3", "P4"], [201, 202], 0.3, 0.6),
+    (["Fz"], [201, 202], 0.2, 0.4),
+]
+
+
+class CrashWorker:
+    """
+    Kills the worker process that unpickles it, like a crash inside a native library.
+    """
+    def __reduce__(self):
+        return os._exit, (1,)
+
+
+if __name__ == "__main__":
+    shared = cr.get_amp_diff_data_param_sets(path, param_sets, max_files=10, n_workers=4)
+
+    for params, participants in zip(param_sets, shared):
+        serial = af.get_amp_diff_data(path, *params, max_files=10)
+        print(params, [p.amp_diff for p in serial] == [p.amp_diff for p in participants])
+
+    # A dead worker only fails the queries that crash it; the others are retried and complete
+    crashing = param_sets + [(["Pz"], CrashWorker(), 0.3, 0.6)]
+    results = {k: {} for k in range(len(crashing))}
+    for k, result in cr.iter_param_sets(path, crashing, max_files=10, n_workers=4):
+        results[k][result.subject] = result
+    for k, params in enumerate(param_sets):
+        serial = af.get_amp_diff_data(path, *params, max_files=10)
+        assert [p.amp_diff for p in serial] == [results[k][i].participant.amp_diff for i in sorted(results[k])]
+    assert results[2] and all(r.error == "worker process crashed" for r in results[2].values())
+    print("crash isolated")
@@ -0,0 +1,29 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath("C:\PyhtonDAP\src"))  # Add src/ to Python's module search path
+
+import erp_stats as es
+from Subjects import EegRecordSubject
+from checkpoint import CohortCheckpoint
+import cohort_runner as cr
+
+
+path = r"src\rodata"
+channels = ["Pz", "P3", "P4"]
+
+if __name__ == "__main__":
+    # Per subject: trial bootstrap and label permutation on the cached epochs
+    records = {}
+    for i in range(1, 4):
+        file_path = rf"{path}\sub-{i:03}\eeg\sub-{i:03}_task-visualoddball_eeg.vhdr"
+        records[i] = EegRecordSubject(file_path).epoch_once(channels)
+    print(es.cohort_subject_stats(records, channels, [201, 202], 0.3, 0.6, seed=0, n_jobs=4))
+
+    # Per cohort: group means by parent education and income
+    checkpoint = CohortCheckpoint("output_p3b.sqlite")
+    df = checkpoint.to_dataframe("visualoddball", cr.run_params_key(channels, [201, 202], 0.3, 0.6))
+    checkpoint.close()
+    for by in ["Highest_Adult_Edu", "Income_Household"]:
+        table, p_value = es.group_stats(df["amp_diff"], df[by], seed=0, n_jobs=4)
+        print(table)
+        print(f"{by}: permutation p = {p_value}")
@@ -0,0 +1,39 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath("C:\PyhtonDAP\src"))  # Add src/ to Python's module search path
+
+import numpy as np
+import mne
+import streaming as st
+from Subjects import EegRecordSubject
+
+
+file_path = r"src\rodata\sub-001\eeg\sub-001_task-visualoddball_eeg.vhdr"
+
+
+def show(monitor, results):
+    print(f"{monitor.n_rare} rare, {monitor.n_freq} frequent: amp_diff = {monitor.amp_diff}")
+
+
+# Replay a finished recording as if it was being recorded. The monitor filters the samples
+# itself, so the unfiltered recording is replayed.
+eeg_r = EegRecordSubject(file_path)
+data = mne.io.read_raw_brainvision(file_path, preload=True).get_data()
+monitor = st.OddballMonitor.from_vhdr(file_path, ["Pz", "P3", "P4"], [201, 202], 0.3, 0.6)
+st.monitor_stream(st.ArraySource(data, eeg_r.events, chunk_size=250), monitor, show)
+offline = eeg_r.find_amp_diff_2(["Pz", "P3", "P4"], [201, 202], 0.3, 0.6)
+print("offline:", offline)
+
+# Chunking does not change the result: the filter state carries over between chunks
+whole = st.OddballMonitor.from_vhdr(file_path, ["Pz", "P3", "P4"], [201, 202], 0.3, 0.6)
+st.monitor_stream(st.ArraySource(data, eeg_r.events, chunk_size=data.shape[1]), whole)
+assert np.isclose(monitor.amp_diff, whole.amp_diff, rtol=1e-9, atol=0), (monitor.amp_diff, whole.amp_diff)
+
+# The causal filter delays and reshapes the P300, so live values follow the offline ones
+# within a tolerance only
+assert monitor.n_dropped == 0
+assert abs(monitor.amp_diff - offline) <= 0.35 * abs(offline), (monitor.amp_diff, offline)
+
+# Follow a recording while it is written (stops after 10 seconds without new data)
+monitor = st.OddballMonitor.from_vhdr(file_path, ["Pz", "P3", "P4"], [201, 202], 0.3, 0.6)
+st.monitor_stream(st.BrainVisionFollower(file_path), monitor, show)